@@ -1,25 +1,28 @@
 import os
 import json
 import shutil
-import uuid
-from datetime import datetime
-from functools import wraps
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_from_directory
-from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from flask_sqlalchemy import SQLAlchemy
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import wraps, lru_cache
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_from_directory, make_response
+from flask_login import LoginManager, login_user, login_required, logout_user, current_user
 from flask_uuid import FlaskUUID
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
-from PIL import Image
-from moviepy.editor import VideoFileClip
-import qrcode
+from sqlalchemy.exc import OperationalError
 from io import BytesIO
-import base64
+import hashlib
 import logging
-import requests
-
-# Setup logging
-logging.basicConfig(level=logging.INFO)
+import click
+from models import (db, configure_database, User, LoginLog, Media, Settings, StorageUsage, ScreenMedia,
+                    SponsorCarousel, Screen, Broadcast)
+from player import init_player, invalidate_display_pages, precompress_static, admit_display_load, notify_broadcasts
+from app_logging import configure_logging, log_event
+from profiling import init_profiling, list_profiles, load_profile, PROFILE_FOLDER, PROFILE_SAMPLE_RATE, PROFILE_KEEP
+
+# Setup logging (queued JSON lines - LOG_FORMAT=text for the classic format)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
@@ -27,144 +30,63 @@ FlaskUUID(app)
 
 # Configuration from environment variables
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'magion-2024-secret-key-change-this')
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:////app/data/infoskaerm.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['UPLOAD_FOLDER'] = '/app/uploads'
-app.config['OPTIMIZED_FOLDER'] = '/app/optimized'
+app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER', '/app/uploads')
+app.config['OPTIMIZED_FOLDER'] = os.environ.get('OPTIMIZED_FOLDER', '/app/optimized')
+app.config['THUMBNAIL_FOLDER'] = os.path.join(app.config['OPTIMIZED_FOLDER'], 'thumbs')
 app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB max
 
 # Create directories if they don't exist
-for folder in ['/app/data', app.config['UPLOAD_FOLDER'], app.config['OPTIMIZED_FOLDER'], '/app/originals']:
+for folder in ['/app/data', app.config['UPLOAD_FOLDER'], app.config['OPTIMIZED_FOLDER'], app.config['THUMBNAIL_FOLDER'], '/app/originals']:
     os.makedirs(folder, exist_ok=True)
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'mp4', 'avi', 'mov', 'webm'}
 
-db = SQLAlchemy(app)
+# Full-text search on media filenames (SQLite FTS5) - set by init_db when the index is available
+MEDIA_FTS_ENABLED = False
+
+configure_database(app)
+init_profiling(app)  # First, so profiles include the other request hooks
+init_player(app)  # Display/player routes - also served read-only by 'player:create_app()'
+
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
-# Database models
-class User(UserMixin, db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(100), unique=True, nullable=False)
-    password_hash = db.Column(db.String(200))
-    is_admin = db.Column(db.Boolean, default=False)
-    role = db.Column(db.String(20), default='user')  # 'admin' or 'user'
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    last_login = db.Column(db.DateTime)
-
-class LoginLog(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
-    username = db.Column(db.String(100))
-    login_time = db.Column(db.DateTime, default=datetime.utcnow)
-    ip_address = db.Column(db.String(50))
-    user_agent = db.Column(db.String(500))
-
-class Media(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    filename = db.Column(db.String(200), nullable=False)
-    original_filename = db.Column(db.String(200), nullable=False)
-    media_type = db.Column(db.String(20))
-    duration = db.Column(db.Integer, default=5000)
-    active = db.Column(db.Boolean, default=True)
-    order_index = db.Column(db.Integer, default=0)
-    uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
-    uploaded_by = db.Column(db.Integer, db.ForeignKey('user.id'))
-    is_global = db.Column(db.Boolean, default=True)  # Global media shown on all screens
-
-    # Expire/scheduling settings
-    expire_at = db.Column(db.DateTime, nullable=True)  # When to stop showing this media
-    auto_delete = db.Column(db.Boolean, default=False)  # Delete file after expire_at
-
-class Settings(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    key = db.Column(db.String(100), unique=True, nullable=False)
-    value = db.Column(db.Text)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-# Association table for Screen <-> Media (many-to-many)
-# We need a proper association object to store screen-specific settings like duration
-class ScreenMedia(db.Model):
-    __tablename__ = 'screen_media'
-    screen_id = db.Column(db.Integer, db.ForeignKey('screen.id'), primary_key=True)
-    media_id = db.Column(db.Integer, db.ForeignKey('media.id'), primary_key=True)
-    order_index = db.Column(db.Integer, default=0)
-    duration = db.Column(db.Integer, nullable=True)  # Screen-specific duration override
-
-class SponsorCarousel(db.Model):
-    """Sponsor logos for carousel ticker"""
-    __tablename__ = 'sponsor_carousel'
-    id = db.Column(db.Integer, primary_key=True)
-    screen_id = db.Column(db.Integer, db.ForeignKey('screen.id'), nullable=False)
-    filename = db.Column(db.String(500), nullable=False)
-    original_filename = db.Column(db.String(200), nullable=False)
-    order_index = db.Column(db.Integer, default=0)
-    uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
-    uploaded_by = db.Column(db.Integer, db.ForeignKey('user.id'))
-
-class Screen(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    uuid = db.Column(db.String(36), unique=True, nullable=False, default=lambda: str(uuid.uuid4()))
-    name = db.Column(db.String(200), nullable=False)
-    description = db.Column(db.Text)
-    location = db.Column(db.String(200))
-    active = db.Column(db.Boolean, default=True)
-    pairing_code = db.Column(db.String(6), unique=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    created_by = db.Column(db.Integer, db.ForeignKey('user.id'))
-
-    # Redirect settings (per screen)
-    redirect_enabled = db.Column(db.Boolean, default=False)
-    redirect_url = db.Column(db.Text)
-
-    # Display mode settings (per screen)
-    display_mode = db.Column(db.String(20), default='media')  # 'media', 'redirect', 'iframe', 'json_api'
-    iframe_url = db.Column(db.Text)
-    iframe_margin_left = db.Column(db.Integer, default=0)  # Left margin in pixels
-    iframe_margin_right = db.Column(db.Integer, default=0)  # Right margin in pixels
-    json_api_url = db.Column(db.Text)
-    json_template = db.Column(db.String(50), default='schedule')  # 'schedule', 'custom'
-    sponsor_logo_path = db.Column(db.String(500))  # Path to sponsor logo image
-    magion_logo_path = db.Column(db.String(500))  # Path to MAGION logo image
-
-    # Sponsor carousel settings
-    carousel_enabled = db.Column(db.Boolean, default=False)  # Enable/disable sponsor carousel
-    carousel_speed = db.Column(db.String(20), default='medium')  # 'slow', 'medium', 'fast'
-
-    # IP tracking and admin fields
-    last_access_ip = db.Column(db.String(50))  # WAN/Public IP (from X-Forwarded-For)
-    last_access_lan_ip = db.Column(db.String(50))  # LAN/Local IP (from remote_addr)
-    last_access_time = db.Column(db.DateTime)  # When was the screen last accessed
-    admin_notes = db.Column(db.Text)  # Internal notes/comments about this screen
-    custom_url = db.Column(db.Text)  # Custom URL field for reference
-
-    # Relationship to media through association object
-    media_associations = db.relationship('ScreenMedia', backref='screen', cascade='all, delete-orphan', order_by='ScreenMedia.order_index')
-
-    # Relationship to sponsor carousel logos
-    carousel_sponsors = db.relationship('SponsorCarousel', backref='screen', cascade='all, delete-orphan', order_by='SponsorCarousel.order_index')
-
-    @property
-    def media_items(self):
-        """Get media items for backwards compatibility"""
-        return [assoc.media for assoc in self.media_associations if assoc.media]
-
-# Add relationship to Media model too
-Media.screen_associations = db.relationship('ScreenMedia', backref='media', cascade='all, delete-orphan')
+# Logged-in users are cached per process, so authenticated requests don't query the users table.
+# Keyed by the session id, which includes the password version. A password change, delete or role change
+# applies at once only in the worker that handled it (invalidate_user); other workers keep serving their
+# cached entry - including old-version sessions - until it is USER_CACHE_TTL old.
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))
+user_cache = {}  # session id -> (loaded_at, detached User)
+user_cache_lock = threading.Lock()
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
-
-@app.context_processor
-def inject_settings():
-    """Make settings available to all templates"""
-    settings_dict = {}
-    for setting in Settings.query.all():
-        settings_dict[setting.key] = setting.value
-    return dict(site_settings=settings_dict)
+    cached = user_cache.get(user_id)
+    now = time.monotonic()
+    if cached and now - cached[0] < USER_CACHE_TTL:
+        return cached[1]
+
+    id_part, _, version = user_id.partition(':')  # Sessions from before versioned ids carry only the id
+    user = db.session.get(User, int(id_part))
+    if not user or (version and version != user.password_version()):
+        return None
+    # Detached, so commits later in a request can't expire the shared copy
+    db.session.expunge(user)
+    with user_cache_lock:
+        # Drop expired entries, so sessions of old password versions don't pile up
+        for key in [key for key, entry in user_cache.items() if now - entry[0] >= USER_CACHE_TTL]:
+            del user_cache[key]
+        user_cache[user_id] = (now, user)
+    return user
+
+def invalidate_user(user_id):
+    """Drop a user's cached sessions - after password, role or account changes"""
+    prefix = f'{user_id}:'
+    with user_cache_lock:
+        for key in [key for key in user_cache if key == str(user_id) or key.startswith(prefix)]:
+            del user_cache[key]
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -178,8 +100,10 @@ def generate_pairing_code():
         if not Screen.query.filter_by(pairing_code=code).first():
             return code
 
-def generate_qr_code(data):
-    """Generate QR code and return as base64 image"""
+@lru_cache(maxsize=int(os.environ.get('QR_CACHE_SIZE', 256)))
+def generate_qr_png(data):
+    """Generate QR code PNG bytes - memoized per screen URL (uuid + host)"""
+    import qrcode
     qr = qrcode.QRCode(version=1, box_size=10, border=4)
     qr.add_data(data)
     qr.make(fit=True)
@@ -187,8 +111,403 @@ def generate_qr_code(data):
 
     buffered = BytesIO()
     img.save(buffered, format="PNG")
-    img_str = base64.b64encode(buffered.getvalue()).decode()
-    return f"data:image/png;base64,{img_str}"
+    return buffered.getvalue()
+
+def screen_display_url(screen):
+    """Absolute display URL for a screen, as encoded in its QR code"""
+    return request.host_url.rstrip('/') + url_for('display_screen', screen_uuid=screen.uuid)
+
+def unique_ids(ids):
+    """Normalise a client-supplied id list to ints, dropping duplicates but keeping order"""
+    seen = set()
+    result = []
+    for value in ids:
+        try:
+            value = int(value)
+        except (ValueError, TypeError):
+            continue
+        if value not in seen:
+            seen.add(value)
+            result.append(value)
+    return result
+
+def bulk_update(model, rows):
+    """Update many rows in one executemany statement - each row dict carries the primary key"""
+    if rows:
+        db.session.execute(db.update(model), rows)
+    return len(rows)
+
+def next_order_index(column, *criteria):
+    """First free order_index at the end of a list - one indexed MAX() lookup, done once per batch"""
+    current = db.session.query(db.func.max(column)).filter(*criteria).scalar()
+    return 0 if current is None else current + 1
+
+# ========== STORAGE ACCOUNTING ==========
+
+STORAGE_AREAS = {
+    'optimized': lambda: app.config['OPTIMIZED_FOLDER'],  # Includes thumbs/
+    'uploads': lambda: app.config['UPLOAD_FOLDER'],
+}
+STORAGE_RECONCILE_INTERVAL = int(os.environ.get('STORAGE_RECONCILE_INTERVAL', 6 * 3600))  # Seconds
+storage_reconcile_lock = threading.Lock()
+
+def adjust_storage(area, size_delta, count_delta):
+    """Atomically adjust the disk usage counters - committed with the caller's transaction"""
+    db.session.execute(
+        db.update(StorageUsage)
+        .where(StorageUsage.area == area)
+        .values(size=StorageUsage.size + size_delta, count=StorageUsage.count + count_delta)
+    )
+
+def track_file(area, path):
+    """Record a newly written file in the usage counters - returns its size"""
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return None
+    adjust_storage(area, size, 1)
+    return size
+
+def remove_file(area, path):
+    """Delete a file and subtract it from the usage counters"""
+    if not path or not os.path.isfile(path):
+        return False
+    size = os.path.getsize(path)
+    os.remove(path)
+    adjust_storage(area, -size, -1)
+    return True
+
+def remove_folder(area, path):
+    """Delete a folder of files (HLS segments) and subtract them from the usage counters"""
+    if not path or not os.path.isdir(path):
+        return False
+    for entry in list(iter_files(path)):
+        remove_file(area, entry.path)
+    shutil.rmtree(path, ignore_errors=True)
+    return True
+
+def upload_url_to_path(url):
+    """Map a stored /uploads/... URL (logos, carousel) to its file in UPLOAD_FOLDER"""
+    if not url or not url.startswith('/uploads/'):
+        return None
+    relative = url[len('/uploads/'):]
+    path = os.path.normpath(os.path.join(app.config['UPLOAD_FOLDER'], relative))
+    # Never resolve outside the upload folder
+    if not path.startswith(os.path.normpath(app.config['UPLOAD_FOLDER']) + os.sep):
+        return None
+    return path
+
+def iter_files(path):
+    """Yield os.DirEntry for every file in a folder tree (os.scandir, no symlinks)"""
+    stack = [path]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry
+        except OSError as e:
+            logger.warning(f"Storage scan skipped a folder: {e}")
+
+def scan_folder(path):
+    """Total size and file count of a folder tree"""
+    size = 0
+    count = 0
+    for entry in iter_files(path):
+        size += entry.stat(follow_symlinks=False).st_size
+        count += 1
+    return size, count
+
+def reconcile_storage():
+    """Rescan the storage folders and reset the counters (corrects drift from manual file changes)"""
+    for area, folder in STORAGE_AREAS.items():
+        size, count = scan_folder(folder())
+        usage = db.session.get(StorageUsage, area)
+        if usage is None:
+            usage = StorageUsage(area=area)
+            db.session.add(usage)
+        if usage.reconciled_at and (usage.size != size or usage.count != count):
+            logger.info(f"Storage reconcile {area}: {usage.size or 0} -> {size} bytes, {usage.count or 0} -> {count} files")
+        usage.size = size
+        usage.count = count
+        usage.reconciled_at = datetime.utcnow()
+    db.session.commit()
+
+def reconcile_storage_in_background():
+    """Start a reconciliation thread unless one is already running in this process"""
+    if not storage_reconcile_lock.acquire(blocking=False):
+        return
+
+    def run():
+        try:
+            with app.app_context():
+                reconcile_storage()
+        except Exception as e:
+            logger.error(f"Storage reconciliation failed: {e}")
+        finally:
+            storage_reconcile_lock.release()
+
+    threading.Thread(target=run, name='storage-reconcile', daemon=True).start()
+
+# ========== LOGOS AND CAROUSEL SPRITES ==========
+
+# Logos are stored at 2x their CSS display size so they stay sharp on 4K screens
+SPONSOR_LOGO_SIZE = (600, 120)  # .header-sponsor-logo: max 300x60
+MAGION_LOGO_SIZE = (600, 100)  # .header-logo-img: 50px high
+CAROUSEL_LOGO_SIZE = (400, 100)  # .carousel-logo: max 200x50
+SPRITE_SCALE = 2
+
+def save_logo(file, directory, filename, max_size):
+    """Save an uploaded logo normalised to its display size - returns the stored filename"""
+    from media_processing import normalize_logo
+    os.makedirs(directory, exist_ok=True)
+
+    raw_path = os.path.join(directory, filename)
+    file.save(raw_path)
+
+    normalized = filename.rsplit('.', 1)[0] + '.png'
+    normalized_path = os.path.join(directory, normalized)
+    if normalize_logo(raw_path, normalized_path, max_size):
+        if normalized_path != raw_path:
+            os.remove(raw_path)
+        track_file('uploads', normalized_path)
+        return normalized
+
+    # Not a raster image Pillow can read (e.g. SVG) - keep it as uploaded
+    track_file('uploads', raw_path)
+    return filename
+
+def rebuild_carousel_sprite(screen):
+    """Pack the screen's carousel logos into one sprite sheet + coordinate map (call when the set changes)"""
+    from media_processing import build_sprite_sheet
+
+    sponsors = SponsorCarousel.query.filter_by(screen_id=screen.id).order_by(SponsorCarousel.order_index).all()
+    sources = [upload_url_to_path(sponsor.filename) for sponsor in sponsors]
+    sources = [path for path in sources if path and os.path.isfile(path)]
+
+    old_sprite = screen.carousel_sprite_path
+    new_sprite = None
+    sprite_map = None
+
+    if sources:
+        # Name follows the logo set, so the URL changes (and caches miss) only when the set changes
+        digest = hashlib.sha1('|'.join(sources).encode()).hexdigest()[:12]
+        sprite_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'carousel', 'sprites')
+        os.makedirs(sprite_dir, exist_ok=True)
+        sprite_filename = f"{screen.uuid}_{digest}.png"
+        sprite_path = os.path.join(sprite_dir, sprite_filename)
+
+        if old_sprite == f"/uploads/carousel/sprites/{sprite_filename}" and os.path.isfile(sprite_path):
+            return
+
+        sprite_map = build_sprite_sheet(sources, sprite_path, CAROUSEL_LOGO_SIZE)
+        if sprite_map:
+            sprite_map['scale'] = SPRITE_SCALE
+            track_file('uploads', sprite_path)
+            new_sprite = f"/uploads/carousel/sprites/{sprite_filename}"
+
+    screen.carousel_sprite_path = new_sprite
+    screen.carousel_sprite_map = json.dumps(sprite_map) if new_sprite else None
+    if old_sprite and old_sprite != new_sprite:
+        remove_file('uploads', upload_url_to_path(old_sprite))
+
+# ========== STORAGE GARBAGE COLLECTION ==========
+
+GC_GRACE_PERIOD = int(os.environ.get('GC_GRACE_PERIOD', 3600))  # Seconds - never sweep files this new (uploads in flight)
+GC_IO_DELAY = float(os.environ.get('GC_IO_DELAY', 0.05))  # Seconds to pause between deletions, keeps NAS I/O responsive
+STORAGE_QUOTA_MB = int(os.environ.get('STORAGE_QUOTA_MB', 0))  # 0 = no quota
+storage_gc_lock = threading.Lock()
+
+def referenced_storage_paths():
+    """Mark phase: every file referenced by Media, Screen and SponsorCarousel"""
+    referenced = set()
+    legacy_original_stems = set()
+
+    for filename, thumbnail, source_filename, playlist in db.session.query(
+            Media.filename, Media.thumbnail, Media.source_filename, Media.stream_playlist):
+        referenced.add(os.path.join(app.config['OPTIMIZED_FOLDER'], filename))
+        if thumbnail:
+            referenced.add(os.path.join(app.config['THUMBNAIL_FOLDER'], thumbnail))
+        if playlist:
+            referenced.update(entry.path for entry in iter_files(stream_folder_path(playlist)))
+        if source_filename:
+            referenced.add(os.path.join(app.config['UPLOAD_FOLDER'], source_filename))
+        elif filename.startswith('opt_'):
+            # Rows from before source_filename was recorded: original is the opt_-less name with any extension
+            legacy_original_stems.add(filename[len('opt_'):].rsplit('.', 1)[0])
+
+    urls = [url for row in db.session.query(Screen.sponsor_logo_path, Screen.magion_logo_path, Screen.carousel_sprite_path) for url in row]
+    urls += [row[0] for row in db.session.query(SponsorCarousel.filename)]
+    urls += [row[0] for row in db.session.query(Broadcast.image_path)]
+    for url in urls:
+        path = upload_url_to_path(url)
+        if path:
+            referenced.add(path)
+
+    return {os.path.normpath(path) for path in referenced}, legacy_original_stems
+
+def find_orphaned_files():
+    """Sweep phase (read-only): files on disk that nothing references and that are past the grace period"""
+    referenced, legacy_original_stems = referenced_storage_paths()
+    upload_root = os.path.normpath(app.config['UPLOAD_FOLDER'])
+    cutoff = time.time() - GC_GRACE_PERIOD
+
+    orphans = []
+    for area, folder in STORAGE_AREAS.items():
+        for entry in iter_files(folder()):
+            path = os.path.normpath(entry.path)
+            if path in referenced:
+                continue
+            if os.path.dirname(path) == upload_root and entry.name.rsplit('.', 1)[0] in legacy_original_stems:
+                continue
+            stat = entry.stat(follow_symlinks=False)
+            if stat.st_mtime > cutoff:
+                continue
+            orphans.append({'area': area, 'path': path, 'size': stat.st_size})
+    return orphans
+
+def media_storage_size(media):
+    """Bytes on disk for a media row (optimized file, thumbnail, HLS segments and original)"""
+    paths = [os.path.join(app.config['OPTIMIZED_FOLDER'], media.filename)]
+    if media.stream_playlist:
+        paths += [entry.path for entry in iter_files(stream_folder_path(media.stream_playlist))]
+    if media.thumbnail:
+        paths.append(os.path.join(app.config['THUMBNAIL_FOLDER'], media.thumbnail))
+    if media.source_filename:
+        paths.append(os.path.join(app.config['UPLOAD_FOLDER'], media.source_filename))
+    return sum(os.path.getsize(path) for path in paths if os.path.isfile(path))
+
+def quota_eviction_candidates(pending_free=0):
+    """Media to delete to get under STORAGE_QUOTA_MB - oldest unused first
+
+    Unused means on no screen's playlist and either inactive or screen-specific.
+    Active global media and anything on a playlist (active or not) is never evicted.
+    """
+    if not STORAGE_QUOTA_MB:
+        return []
+
+    used = db.session.query(db.func.coalesce(db.func.sum(StorageUsage.size), 0)).scalar()
+    excess = used - pending_free - STORAGE_QUOTA_MB * 1024 * 1024
+    if excess <= 0:
+        return []
+
+    assigned = db.session.query(ScreenMedia.media_id)
+    unused = Media.query.filter(
+        ~Media.id.in_(assigned),  # On a screen's playlist (even inactive) - never evicted
+        db.or_(Media.active == False, Media.is_global == False)  # noqa: E712
+    ).order_by(Media.uploaded_at).all()
+
+    candidates = []
+    freed = 0
+    for media in unused:
+        if freed >= excess:
+            break
+        candidates.append(media)
+        freed += media_storage_size(media)
+    return candidates
+
+def run_storage_gc(dry_run=True):
+    """Mark-and-sweep storage GC plus quota eviction - returns a report"""
+    orphans = find_orphaned_files()
+    evictions = quota_eviction_candidates(pending_free=sum(orphan['size'] for orphan in orphans))
+
+    report = {
+        'dry_run': dry_run,
+        'orphan_count': len(orphans),
+        'orphan_bytes': sum(orphan['size'] for orphan in orphans),
+        'orphans': [{'area': o['area'], 'path': o['path'], 'size': o['size']} for o in orphans],
+        'quota_mb': STORAGE_QUOTA_MB,
+        'evictions': [{'id': m.id, 'original_filename': m.original_filename,
+                       'uploaded_at': m.uploaded_at.isoformat() if m.uploaded_at else None} for m in evictions],
+        'deleted_files': 0,
+        'evicted_media': 0
+    }
+    if dry_run:
+        return report
+
+    for orphan in orphans:
+        try:
+            if remove_file(orphan['area'], orphan['path']):
+                report['deleted_files'] += 1
+                db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"GC could not delete {orphan['path']}: {e}")
+        time.sleep(GC_IO_DELAY)
+
+    for media in evictions:
+        try:
+            remove_media_files(media)
+            db.session.delete(media)
+            db.session.commit()
+            invalidate_display_pages()
+            report['evicted_media'] += 1
+            logger.info(f"Quota eviction: {media.original_filename}")
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"GC could not evict media {media.id}: {e}")
+        time.sleep(GC_IO_DELAY)
+
+    logger.info(f"Storage GC: deleted {report['deleted_files']} orphaned files "
+                f"({report['orphan_bytes'] / (1024 * 1024):.1f} MB), evicted {report['evicted_media']} media")
+    return report
+
+def run_storage_gc_in_background():
+    """Start a GC thread unless one is already running in this process - returns False if busy"""
+    if not storage_gc_lock.acquire(blocking=False):
+        return False
+
+    def run():
+        try:
+            with app.app_context():
+                run_storage_gc(dry_run=False)
+        except Exception as e:
+            logger.error(f"Storage GC failed: {e}")
+        finally:
+            storage_gc_lock.release()
+
+    threading.Thread(target=run, name='storage-gc', daemon=True).start()
+    return True
+
+def generate_thumbnail(optimized_filename, media_type):
+    """Create the dashboard thumbnail for an optimized file - returns its filename or None"""
+    from media_processing import create_thumbnail, thumbnail_filename
+    thumbnail = thumbnail_filename(optimized_filename)
+    source_path = os.path.join(app.config['OPTIMIZED_FOLDER'], optimized_filename)
+    thumbnail_path = os.path.join(app.config['THUMBNAIL_FOLDER'], thumbnail)
+    if not create_thumbnail(source_path, thumbnail_path, media_type):
+        return None
+    track_file('optimized', thumbnail_path)
+    return thumbnail
+
+def stream_folder_path(playlist):
+    """Folder holding an HLS playlist and its segments"""
+    return os.path.dirname(os.path.join(app.config['OPTIMIZED_FOLDER'], playlist))
+
+def package_video_stream(optimized_filename):
+    """Package an optimized video as HLS segments when VIDEO_PACKAGING=hls - returns the playlist or None"""
+    from media_processing import VIDEO_PACKAGING, package_hls, stream_playlist
+    if VIDEO_PACKAGING != 'hls':
+        return None
+    playlist = stream_playlist(optimized_filename)
+    video_path = os.path.join(app.config['OPTIMIZED_FOLDER'], optimized_filename)
+    if not package_hls(video_path, os.path.join(app.config['OPTIMIZED_FOLDER'], playlist)):
+        return None
+    for entry in iter_files(stream_folder_path(playlist)):
+        track_file('optimized', entry.path)
+    return playlist
+
+def remove_media_files(media):
+    """Remove the optimized file, thumbnail, HLS segments and original upload belonging to a media row"""
+    remove_file('optimized', os.path.join(app.config['OPTIMIZED_FOLDER'], media.filename))
+    if media.stream_playlist:
+        remove_folder('optimized', stream_folder_path(media.stream_playlist))
+    if media.thumbnail:
+        remove_file('optimized', os.path.join(app.config['THUMBNAIL_FOLDER'], media.thumbnail))
+    if media.source_filename:
+        remove_file('uploads', os.path.join(app.config['UPLOAD_FOLDER'], media.source_filename))
 
 def cleanup_expired_media():
     """Check and cleanup expired media files"""
@@ -202,9 +521,7 @@ def cleanup_expired_media():
         if media.auto_delete:
             # Delete file and database entry
             try:
-                optimized_path = os.path.join(app.config['OPTIMIZED_FOLDER'], media.filename)
-                if os.path.exists(optimized_path):
-                    os.remove(optimized_path)
+                remove_media_files(media)
                 db.session.delete(media)
                 deleted_count += 1
                 logger.info(f"Auto-deleted expired media: {media.original_filename}")
@@ -219,68 +536,10 @@ def cleanup_expired_media():
 
     if cleaned_count > 0 or deleted_count > 0:
         db.session.commit()
+        invalidate_display_pages()
 
     return {'deactivated': cleaned_count, 'deleted': deleted_count}
 
-def optimize_image(input_path, output_path):
-    """Optimize image to EXACTLY 1920x1080 with black background"""
-    try:
-        img = Image.open(input_path)
-
-        # Convert to RGB if needed
-        if img.mode in ('RGBA', 'LA', 'P'):
-            background = Image.new('RGB', img.size, (0, 0, 0))
-            if img.mode == 'RGBA':
-                background.paste(img, mask=img.split()[3])
-            else:
-                background.paste(img)
-            img = background
-        elif img.mode != 'RGB':
-            img = img.convert('RGB')
-
-        # RESIZE TO FIT 1920x1080 WITH BLACK BACKGROUND
-        # This ensures ALL images are EXACTLY 1920x1080
-
-        # Calculate new size maintaining aspect ratio
-        img.thumbnail((1920, 1080), Image.Resampling.LANCZOS)
-
-        # Create black canvas at EXACT 1920x1080
-        final_img = Image.new('RGB', (1920, 1080), (0, 0, 0))
-
-        # Center the image on the canvas
-        x_offset = (1920 - img.width) // 2
-        y_offset = (1080 - img.height) // 2
-        final_img.paste(img, (x_offset, y_offset))
-
-        # Save optimized image
-        final_img.save(output_path, 'JPEG', quality=85, optimize=True)
-
-        logger.info(f"Image optimized: {os.path.basename(input_path)} -> 1920x1080")
-        return True
-    except Exception as e:
-        logger.error(f"Error optimizing image: {e}")
-        return False
-
-def optimize_video(input_path, output_path):
-    """Optimize video for display"""
-    try:
-        video = VideoFileClip(input_path)
-        
-        if video.w > 1920 or video.h > 1080:
-            if video.w / video.h > 1920 / 1080:
-                video = video.resize(width=1920)
-            else:
-                video = video.resize(height=1080)
-        
-        video.write_videofile(output_path, codec='libx264', audio_codec='aac', bitrate='5000k')
-        duration = int(video.duration * 1000)
-        video.close()
-        return duration
-    except Exception as e:
-        logger.error(f"Error optimizing video: {e}")
-        shutil.copy2(input_path, output_path)
-        return 30000
-
 @app.route('/')
 def index():
     if current_user.is_authenticated:
@@ -373,7 +632,10 @@ def upload_file():
         flash('Ingen fil valgt', 'error')
         return redirect(url_for('dashboard'))
     
+    from media_processing import optimize_image, optimize_video
+
     files = request.files.getlist('file')
+    order_index = next_order_index(Media.order_index)
     
     for file in files:
         if file and allowed_file(file.filename):
@@ -383,6 +645,7 @@ def upload_file():
             
             upload_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
             file.save(upload_path)
+            track_file('uploads', upload_path)
             
             ext = filename.rsplit('.', 1)[1].lower()
             is_video = ext in ['mp4', 'avi', 'mov', 'webm']
@@ -407,12 +670,18 @@ def upload_file():
                 original_filename=original_filename,
                 media_type=media_type,
                 duration=duration,
+                thumbnail=generate_thumbnail(optimized_filename, media_type),
+                file_size=track_file('optimized', optimized_path),
+                stream_playlist=package_video_stream(optimized_filename) if is_video else None,
+                source_filename=filename,
                 uploaded_by=current_user.id,
-                order_index=Media.query.count()
+                order_index=order_index
             )
             db.session.add(media)
+            order_index += 1
     
     db.session.commit()
+    invalidate_display_pages()
     flash('Filer uploadet succesfuldt', 'success')
     return redirect(url_for('dashboard'))
 
@@ -422,14 +691,13 @@ def delete_media(media_id):
     media = Media.query.get_or_404(media_id)
     
     try:
-        optimized_path = os.path.join(app.config['OPTIMIZED_FOLDER'], media.filename)
-        if os.path.exists(optimized_path):
-            os.remove(optimized_path)
+        remove_media_files(media)
     except:
         pass
     
     db.session.delete(media)
     db.session.commit()
+    invalidate_display_pages()
     
     flash('Fil slettet', 'success')
     return redirect(url_for('dashboard'))
@@ -440,6 +708,7 @@ def toggle_media(media_id):
     media = Media.query.get_or_404(media_id)
     media.active = not media.active
     db.session.commit()
+    invalidate_display_pages()
     
     return jsonify({'active': media.active})
 
@@ -451,6 +720,7 @@ def update_duration(media_id):
 
     media.duration = duration
     db.session.commit()
+    invalidate_display_pages()
 
     return jsonify({'success': True})
 
@@ -483,15 +753,20 @@ def update_media_expire(media_id):
 @app.route('/reorder', methods=['POST'])
 @login_required
 def reorder_media():
-    order = request.json.get('order', [])
-    
-    for index, media_id in enumerate(order):
-        media = Media.query.get(media_id)
-        if media:
-            media.order_index = index
-    
+    order = unique_ids(request.json.get('order', []))
+
+    # One SELECT for current positions, one executemany UPDATE for the rows that moved
+    current = dict(db.session.query(Media.id, Media.order_index).filter(Media.id.in_(order)).all()) if order else {}
+    changes = [
+        {'id': media_id, 'order_index': index}
+        for index, media_id in enumerate(order)
+        if media_id in current and current[media_id] != index
+    ]
+    updated = bulk_update(Media, changes)
+
     db.session.commit()
-    return jsonify({'success': True})
+    invalidate_display_pages()
+    return jsonify({'success': True, 'updated': updated})
 
 @app.route('/settings', methods=['POST'])
 @login_required
@@ -528,12 +803,16 @@ def update_settings():
                 db.session.add(setting)
 
     db.session.commit()
+    invalidate_display_pages()
     flash('Indstillinger opdateret', 'success')
     return redirect(url_for('dashboard'))
 
 @app.route('/secure-display-x9k2m8p4q7')
 def display():
     """Display screen - no login required, checks for redirect override"""
+    deferred = admit_display_load()
+    if deferred:
+        return deferred
 
     # Check if redirect is enabled
     redirect_enabled = Settings.query.filter_by(key='redirect_enabled').first()
@@ -541,7 +820,8 @@ def display():
 
     # If redirect is enabled and URL is set, redirect to external URL
     if redirect_enabled and redirect_enabled.value == 'True' and redirect_url and redirect_url.value:
-        logger.info(f"Redirect active - redirecting to: {redirect_url.value}")
+        log_event(logger, 'screen.mode', 'global', 'Global display redirect active - redirecting to: {url}',
+                  screen='global', mode='redirect', url=redirect_url.value)
         return redirect(redirect_url.value)
 
     # Normal display flow
@@ -552,98 +832,19 @@ def display():
         media_list.append({
             'type': media.media_type,
             'path': f'/media/{media.filename}',
-            'duration': media.duration
+            'duration': media.duration,
+            'size': media.file_size,
+            'stream': f'/media/{media.stream_playlist}' if media.stream_playlist else None
         })
 
     return render_template('display.html', media_list=json.dumps(media_list))
 
-@app.route('/media/<filename>')
-def serve_media(filename):
-    """Serve optimized media files"""
-    return send_from_directory(app.config['OPTIMIZED_FOLDER'], filename)
-
-@app.route('/uploads/<path:filename>')
-def serve_uploads(filename):
-    """Serve uploaded files (e.g., sponsor logos)"""
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
-
-@app.route('/api/media-list')
-def api_media_list():
-    """API endpoint for media list"""
-    media_files = Media.query.filter_by(active=True).order_by(Media.order_index, Media.uploaded_at.desc()).all()
-
-    media_list = []
-    for media in media_files:
-        media_list.append({
-            'type': media.media_type,
-            'path': f'/media/{media.filename}',
-            'duration': media.duration
-        })
-
-    return jsonify(media_list)
-
-@app.route('/api/screen/<screen_uuid>/settings')
-def api_screen_settings(screen_uuid):
-    """API endpoint for screen settings - used by display pages for periodic checks"""
-    try:
-        screen = Screen.query.filter_by(uuid=screen_uuid).first()
-        if not screen:
-            return jsonify({'error': 'Screen not found'}), 404
-
-        carousel_sponsors = []
-        if screen.carousel_enabled:
-            carousel_sponsors = [s.filename for s in screen.carousel_sponsors]
-
-        return jsonify({
-            'display_mode': screen.display_mode,
-            'json_template': screen.json_template,
-            'carousel_enabled': screen.carousel_enabled,
-            'carousel_speed': screen.carousel_speed or 'medium',
-            'carousel_sponsors_count': len(carousel_sponsors),
-            'magion_logo': screen.magion_logo_path,
-            'sponsor_logo': screen.sponsor_logo_path
-        })
-    except Exception as e:
-        logger.error(f"Error getting screen settings: {e}")
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/api/screen/<screen_uuid>/json-data')
-def api_screen_json_data(screen_uuid):
-    """API endpoint for JSON data - used by display_json.html for periodic data refresh"""
-    try:
-        screen = Screen.query.filter_by(uuid=screen_uuid).first()
-        if not screen:
-            return jsonify({'error': 'Screen not found'}), 404
-
-        if not screen.json_api_url:
-            return jsonify({'error': 'No JSON API URL configured'}), 400
-
-        # Fetch fresh JSON data from external API
-        try:
-            response = requests.get(screen.json_api_url, timeout=10)
-            if response.status_code == 200:
-                json_data = response.json()
-                return jsonify({
-                    'success': True,
-                    'data': json_data,
-                    'timestamp': datetime.utcnow().isoformat()
-                })
-            else:
-                logger.error(f"JSON API returned status {response.status_code}")
-                return jsonify({
-                    'success': False,
-                    'error': f'API returned status {response.status_code}'
-                }), response.status_code
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to fetch JSON API: {e}")
-            return jsonify({
-                'success': False,
-                'error': 'Network error fetching JSON data',
-                'details': str(e)
-            }), 503
-    except Exception as e:
-        logger.error(f"Error in JSON data endpoint: {e}")
-        return jsonify({'success': False, 'error': str(e)}), 500
+@app.route('/thumbs/<filename>')
+def serve_thumbnail(filename):
+    """Serve dashboard thumbnails - names follow the timestamped media file, so they never change"""
+    response = send_from_directory(app.config['THUMBNAIL_FOLDER'], filename, max_age=31536000)
+    response.cache_control.immutable = True
+    return response
 
 @app.route('/api/screen/<screen_uuid>/report-lan-ip', methods=['POST'])
 def report_lan_ip(screen_uuid):
@@ -659,7 +860,8 @@ def report_lan_ip(screen_uuid):
         if lan_ip:
             screen.last_access_lan_ip = lan_ip
             db.session.commit()
-            logger.info(f"Screen {screen.name} reported LAN IP: {lan_ip}")
+            log_event(logger, 'screen.lan_ip', screen.uuid, 'Screen {screen} reported LAN IP: {lan_ip}',
+                      screen=screen.name, screen_uuid=screen.uuid, lan_ip=lan_ip)
             return jsonify({'success': True, 'lan_ip': lan_ip})
         else:
             return jsonify({'error': 'No LAN IP provided'}), 400
@@ -667,15 +869,115 @@ def report_lan_ip(screen_uuid):
         logger.error(f"Error updating LAN IP for screen {screen_uuid}: {e}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/redirect-check')
-def redirect_check():
-    """API endpoint to check redirect status - used by display.html for periodic checks"""
-    redirect_enabled = Settings.query.filter_by(key='redirect_enabled').first()
-    redirect_url = Settings.query.filter_by(key='redirect_url').first()
+def parse_bool_arg(name):
+    """Read an optional true/false query parameter - None when absent"""
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+def media_search_filter(search, use_fts=True):
+    """Filter for a filename search - FTS5 prefix match when available, LIKE otherwise (None = no terms)"""
+    terms = [term for term in search.replace('"', ' ').split() if term]
+    if not terms:
+        return None
+    if use_fts and MEDIA_FTS_ENABLED:
+        # Quote each term so user input can't inject FTS syntax, and match on prefixes
+        fts_query = ' '.join(f'"{term}"*' for term in terms)
+        return db.text("media.id IN (SELECT rowid FROM media_fts WHERE media_fts MATCH :fts_query)").bindparams(fts_query=fts_query)
+    return db.and_(*[Media.original_filename.ilike(f'%{term}%') for term in terms])
+
+def search_media_page(query, search, limit, use_fts):
+    """Apply the search filter (if any) and fetch one page in dashboard order"""
+    search_filter = media_search_filter(search, use_fts)
+    if search_filter is not None:
+        query = query.filter(search_filter)
+    return query.order_by(Media.order_index, Media.id.desc()).limit(limit).all()
+
+@app.route('/api/media-library')
+@login_required
+def api_media_library():
+    """Paginated, filterable media library for the dashboard (keyset pagination)
+
+    Query params: limit, cursor, q, type, active, global, expired, screen
+    Ordered like the dashboard: order_index ascending, newest first within the same index.
+    """
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 200)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+
+    query = Media.query
+
+    media_type = request.args.get('type')
+    if media_type:
+        query = query.filter(Media.media_type == media_type)
+
+    active = parse_bool_arg('active')
+    if active is not None:
+        query = query.filter(Media.active == active)
+
+    is_global = parse_bool_arg('global')
+    if is_global is not None:
+        query = query.filter(Media.is_global == is_global)
+
+    expired = parse_bool_arg('expired')
+    if expired is not None:
+        now = datetime.utcnow()
+        if expired:
+            query = query.filter(Media.expire_at.isnot(None), Media.expire_at <= now)
+        else:
+            query = query.filter(db.or_(Media.expire_at.is_(None), Media.expire_at > now))
+
+    screen_id = request.args.get('screen', type=int)
+    if screen_id is not None:
+        query = query.join(ScreenMedia, ScreenMedia.media_id == Media.id).filter(ScreenMedia.screen_id == screen_id)
+
+    # Cursor is "<order_index>:<id>" of the last item on the previous page
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            last_order, last_id = (int(part) for part in cursor.split(':'))
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        query = query.filter(db.or_(
+            Media.order_index > last_order,
+            db.and_(Media.order_index == last_order, Media.id < last_id)
+        ))
+
+    search = request.args.get('q', '').strip()
+    try:
+        rows = search_media_page(query, search, limit + 1, use_fts=True)
+    except OperationalError as e:
+        # Search box input must never 500 - retry the same page with LIKE
+        db.session.rollback()
+        logger.warning(f"Media FTS search failed, using LIKE: {e.orig}")
+        rows = search_media_page(query, search, limit + 1, use_fts=False)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    items = []
+    for media in rows:
+        items.append({
+            'id': media.id,
+            'filename': media.filename,
+            'original_filename': media.original_filename,
+            'media_type': media.media_type,
+            'path': f'/media/{media.filename}',
+            'thumbnail': url_for('serve_thumbnail', filename=media.thumbnail) if media.thumbnail else None,
+            'duration': media.duration,
+            'active': media.active,
+            'is_global': media.is_global,
+            'order_index': media.order_index,
+            'uploaded_at': media.uploaded_at.isoformat() if media.uploaded_at else None,
+            'expire_at': media.expire_at.isoformat() if media.expire_at else None,
+            'auto_delete': media.auto_delete
+        })
 
     return jsonify({
-        'redirect_enabled': redirect_enabled.value == 'True' if redirect_enabled else False,
-        'redirect_url': redirect_url.value if redirect_url else ''
+        'items': items,
+        'has_more': has_more,
+        'next_cursor': f"{rows[-1].order_index}:{rows[-1].id}" if has_more else None
     })
 
 @app.route('/api/cleanup-expired', methods=['POST'])
@@ -708,48 +1010,32 @@ def get_media_expire_status(media_id):
 @app.route('/api/cache-info')
 @login_required
 def get_cache_info():
-    """Get cache information - media files size"""
-    import os
+    """Get cache information - media files size (answered from the storage counters)"""
+    usage = {row.area: row for row in StorageUsage.query.all()}
+    optimized = usage.get('optimized')
+    uploads = usage.get('uploads')
+
+    # Counters are kept up to date on every write; a periodic rescan corrects any drift
+    oldest_scan = min((row.reconciled_at or datetime.min for row in usage.values()), default=datetime.min)
+    if len(usage) < len(STORAGE_AREAS) or (datetime.utcnow() - oldest_scan).total_seconds() > STORAGE_RECONCILE_INTERVAL:
+        reconcile_storage_in_background()
 
     cache_info = {
         'optimized_folder': {
             'path': app.config['OPTIMIZED_FOLDER'],
-            'size': 0,
-            'count': 0,
-            'files': []
+            'size': optimized.size if optimized else 0,
+            'count': optimized.count if optimized else 0
         },
         'uploads_folder': {
             'path': app.config['UPLOAD_FOLDER'],
-            'size': 0,
-            'count': 0
+            'size': uploads.size if uploads else 0,
+            'count': uploads.count if uploads else 0
         },
         'total_media_db': Media.query.count(),
-        'active_media_db': Media.query.filter_by(active=True).count()
+        'active_media_db': Media.query.filter_by(active=True).count(),
+        'reconciled_at': oldest_scan.isoformat() if oldest_scan != datetime.min else None
     }
 
-    # Calculate optimized folder size
-    if os.path.exists(app.config['OPTIMIZED_FOLDER']):
-        for filename in os.listdir(app.config['OPTIMIZED_FOLDER']):
-            filepath = os.path.join(app.config['OPTIMIZED_FOLDER'], filename)
-            if os.path.isfile(filepath):
-                size = os.path.getsize(filepath)
-                cache_info['optimized_folder']['size'] += size
-                cache_info['optimized_folder']['count'] += 1
-                cache_info['optimized_folder']['files'].append({
-                    'name': filename,
-                    'size': size,
-                    'modified': os.path.getmtime(filepath)
-                })
-
-    # Calculate uploads folder size
-    if os.path.exists(app.config['UPLOAD_FOLDER']):
-        for root, dirs, files in os.walk(app.config['UPLOAD_FOLDER']):
-            for filename in files:
-                filepath = os.path.join(root, filename)
-                if os.path.isfile(filepath):
-                    cache_info['uploads_folder']['size'] += os.path.getsize(filepath)
-                    cache_info['uploads_folder']['count'] += 1
-
     # Convert to MB
     cache_info['optimized_folder']['size_mb'] = cache_info['optimized_folder']['size'] / (1024 * 1024)
     cache_info['uploads_folder']['size_mb'] = cache_info['uploads_folder']['size'] / (1024 * 1024)
@@ -757,6 +1043,17 @@ def get_cache_info():
 
     return jsonify(cache_info)
 
+@app.route('/api/storage/gc', methods=['POST'])
+@login_required
+@admin_required
+def api_storage_gc():
+    """Storage garbage collection (Admin only) - dry run report by default, dry_run=false to delete"""
+    if parse_bool_arg('dry_run') is False:
+        started = run_storage_gc_in_background()
+        return jsonify({'success': started, 'started': started}), 202 if started else 409
+
+    return jsonify(run_storage_gc(dry_run=True))
+
 # ========== SCREEN MANAGEMENT ROUTES ==========
 
 @app.route('/screen/create', methods=['POST'])
@@ -788,6 +1085,7 @@ def delete_screen(screen_id):
     screen = Screen.query.get_or_404(screen_id)
     db.session.delete(screen)
     db.session.commit()
+    invalidate_display_pages(screen)
 
     flash('Skærm slettet', 'success')
     return redirect(url_for('dashboard'))
@@ -799,46 +1097,90 @@ def toggle_screen(screen_id):
     screen = Screen.query.get_or_404(screen_id)
     screen.active = not screen.active
     db.session.commit()
+    invalidate_display_pages(screen)
 
     return jsonify({'active': screen.active})
 
 @app.route('/screen/<int:screen_id>/qr')
 @login_required
 def screen_qr_code(screen_id):
-    """Generate QR code for screen URL"""
+    """QR code info for screen URL - the image itself is served by screen_qr_png"""
     screen = Screen.query.get_or_404(screen_id)
-    screen_url = request.host_url.rstrip('/') + url_for('display_screen', screen_uuid=screen.uuid)
-    qr_code = generate_qr_code(screen_url)
 
     return jsonify({
-        'qr_code': qr_code,
-        'url': screen_url,
+        'qr_code': url_for('screen_qr_png', screen_id=screen.id),
+        'url': screen_display_url(screen),
         'screen_name': screen.name
     })
 
+@app.route('/screen/<int:screen_id>/qr.png')
+@login_required
+def screen_qr_png(screen_id):
+    """Serve the screen QR code as a cacheable PNG with ETag"""
+    screen = Screen.query.get_or_404(screen_id)
+    screen_url = screen_display_url(screen)
+
+    # ETag is derived from the encoded URL, so revalidation never renders the image
+    etag = hashlib.sha1(screen_url.encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(generate_qr_png(screen_url))
+        response.mimetype = 'image/png'
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = 86400
+    return response
+
+@app.route('/screens/qr-sheet')
+@login_required
+def screens_qr_sheet():
+    """Printable sheet with QR codes for all screens"""
+    screens = Screen.query.order_by(Screen.name).all()
+    sheet = [{'screen': screen, 'url': screen_display_url(screen)} for screen in screens]
+    return render_template('qr_sheet.html', sheet=sheet)
+
 @app.route('/screen/<int:screen_id>/assign-media', methods=['POST'])
 @login_required
 def assign_media_to_screen(screen_id):
     """Assign media files to a screen"""
     screen = Screen.query.get_or_404(screen_id)
-    media_ids = request.json.get('media_ids', [])
-
-    # Clear existing assignments
-    ScreenMedia.query.filter_by(screen_id=screen_id).delete()
-
-    # Add new assignments
-    for idx, media_id in enumerate(media_ids):
-        media = Media.query.get(media_id)
-        if media:
-            assoc = ScreenMedia(
-                screen_id=screen_id,
-                media_id=media_id,
-                order_index=idx
-            )
-            db.session.add(assoc)
+    requested_ids = unique_ids(request.json.get('media_ids', []))
+
+    # Only keep ids that exist (one query instead of one per item)
+    existing_media = set()
+    if requested_ids:
+        existing_media = {row[0] for row in db.session.query(Media.id).filter(Media.id.in_(requested_ids)).all()}
+    media_ids = [media_id for media_id in requested_ids if media_id in existing_media]
+
+    # Diff against the current assignments so unchanged rows (and their duration overrides) are untouched
+    current = dict(db.session.query(ScreenMedia.media_id, ScreenMedia.order_index).filter_by(screen_id=screen.id).all())
+    wanted = {media_id: index for index, media_id in enumerate(media_ids)}
+
+    removed = [media_id for media_id in current if media_id not in wanted]
+    added = [
+        {'screen_id': screen.id, 'media_id': media_id, 'order_index': index}
+        for media_id, index in wanted.items() if media_id not in current
+    ]
+    moved = [
+        {'screen_id': screen.id, 'media_id': media_id, 'order_index': index}
+        for media_id, index in wanted.items() if media_id in current and current[media_id] != index
+    ]
+
+    if removed:
+        ScreenMedia.query.filter(ScreenMedia.screen_id == screen.id, ScreenMedia.media_id.in_(removed)).delete(synchronize_session=False)
+    if added:
+        db.session.execute(db.insert(ScreenMedia), added)
+    bulk_update(ScreenMedia, moved)
 
     db.session.commit()
-    return jsonify({'success': True})
+    invalidate_display_pages(screen)
+    return jsonify({
+        'success': True,
+        'added': len(added),
+        'removed': len(removed),
+        'reordered': len(moved)
+    })
 
 @app.route('/screen/<int:screen_id>/media/<int:media_id>/duration', methods=['POST'])
 @login_required
@@ -855,6 +1197,7 @@ def update_screen_media_duration(screen_id, media_id):
         assoc.duration = None  # Use media default
 
     db.session.commit()
+    invalidate_display_pages(assoc.screen)
 
     return jsonify({
         'success': True,
@@ -868,19 +1211,22 @@ def reorder_screen_media(screen_id):
     screen = Screen.query.get_or_404(screen_id)
 
     data = request.json
-    media_ids = data.get('media_ids', [])
+    media_ids = unique_ids(data.get('media_ids', []))
 
     if not media_ids:
         return jsonify({'success': False, 'error': 'No media IDs provided'}), 400
 
     try:
-        # Update order_index for each media association
-        for index, media_id in enumerate(media_ids):
-            assoc = ScreenMedia.query.filter_by(screen_id=screen_id, media_id=media_id).first()
-            if assoc:
-                assoc.order_index = index
+        # Load all positions for the screen once, then update only the associations that moved
+        current = dict(db.session.query(ScreenMedia.media_id, ScreenMedia.order_index).filter_by(screen_id=screen.id).all())
+        bulk_update(ScreenMedia, [
+            {'screen_id': screen.id, 'media_id': media_id, 'order_index': index}
+            for index, media_id in enumerate(media_ids)
+            if media_id in current and current[media_id] != index
+        ])
 
         db.session.commit()
+        invalidate_display_pages(screen)
         logger.info(f"Reordered {len(media_ids)} media items for screen {screen.name}")
 
         return jsonify({
@@ -892,122 +1238,6 @@ def reorder_screen_media(screen_id):
         logger.error(f"Error reordering media for screen {screen_id}: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/screen/<uuid:screen_uuid>')
-def display_screen(screen_uuid):
-    """Display screen by UUID - shows screen-specific content"""
-    screen = Screen.query.filter_by(uuid=str(screen_uuid)).first_or_404()
-
-    # Track IP address and last access time
-    try:
-        # Get WAN IP (from proxy/X-Forwarded-For)
-        wan_ip = request.headers.get('X-Forwarded-For')
-        if wan_ip and ',' in wan_ip:
-            # X-Forwarded-For can contain multiple IPs, take the first one
-            wan_ip = wan_ip.split(',')[0].strip()
-
-        # Get LAN IP (from X-Real-IP header set by nginx proxy)
-        # Falls back to request.remote_addr if header not present
-        lan_ip = request.headers.get('X-Real-IP') or request.remote_addr
-
-        # Update screen access info
-        screen.last_access_ip = wan_ip if wan_ip else lan_ip  # WAN IP (or LAN if no proxy)
-        screen.last_access_lan_ip = lan_ip  # Always save LAN IP
-        screen.last_access_time = datetime.utcnow()
-        db.session.commit()
-
-        logger.info(f"Screen {screen.name} accessed - WAN: {wan_ip or 'N/A'}, LAN: {lan_ip}")
-    except Exception as e:
-        logger.warning(f"Failed to update screen access info: {e}")
-        # Don't fail the request if IP tracking fails
-        db.session.rollback()
-
-    # Check display mode and handle accordingly
-    display_mode = screen.display_mode or 'media'
-
-    # Legacy support: if redirect_enabled is True, use redirect mode
-    if screen.redirect_enabled and screen.redirect_url:
-        display_mode = 'redirect'
-
-    # Handle different display modes
-    if display_mode == 'redirect' and screen.redirect_url:
-        logger.info(f"Screen {screen.name} redirect mode - redirecting to: {screen.redirect_url}")
-        return redirect(screen.redirect_url)
-
-    elif display_mode == 'iframe' and screen.iframe_url:
-        logger.info(f"Screen {screen.name} iframe mode - showing: {screen.iframe_url}")
-        return render_template('display_iframe.html',
-                             iframe_url=screen.iframe_url,
-                             iframe_margin_left=screen.iframe_margin_left or 0,
-                             iframe_margin_right=screen.iframe_margin_right or 0,
-                             screen_name=screen.name,
-                             screen_uuid=str(screen_uuid))
-
-    elif display_mode == 'json_api' and screen.json_api_url:
-        logger.info(f"Screen {screen.name} JSON API mode - fetching from: {screen.json_api_url}")
-        # Fetch JSON data
-        import requests
-        try:
-            response = requests.get(screen.json_api_url, timeout=10)
-            json_data = response.json() if response.status_code == 200 else []
-        except Exception as e:
-            logger.error(f"Failed to fetch JSON API: {e}")
-            json_data = []
-
-        # Get carousel sponsors if enabled
-        carousel_sponsors = []
-        if screen.carousel_enabled:
-            carousel_sponsors = [s.filename for s in screen.carousel_sponsors]
-
-        return render_template('display_json.html',
-                             json_data=json.dumps(json_data),
-                             json_template=screen.json_template or 'schedule',
-                             screen_name=screen.name,
-                             screen_uuid=str(screen_uuid),
-                             sponsor_logo=screen.sponsor_logo_path,
-                             magion_logo=screen.magion_logo_path,
-                             carousel_enabled=screen.carousel_enabled,
-                             carousel_speed=screen.carousel_speed or 'medium',
-                             carousel_sponsors=carousel_sponsors)
-
-    # Default: media rotation mode
-    if not screen.active:
-        return render_template('display.html',
-                             media_list=json.dumps([]),
-                             screen_name=screen.name,
-                             screen_inactive=True)
-
-    media_list = []
-
-    # Get screen-specific media with custom durations
-    if screen.media_associations:
-        for assoc in screen.media_associations:
-            media = assoc.media
-            if media and media.active:
-                # Use screen-specific duration if set, otherwise use media default
-                duration = assoc.duration if assoc.duration else media.duration
-                media_list.append({
-                    'type': media.media_type,
-                    'path': f'/media/{media.filename}',
-                    'duration': duration
-                })
-    else:
-        # No screen-specific media, use global media
-        global_media = Media.query.filter_by(active=True, is_global=True).order_by(
-            Media.order_index, Media.uploaded_at.desc()
-        ).all()
-
-        for media in global_media:
-            media_list.append({
-                'type': media.media_type,
-                'path': f'/media/{media.filename}',
-                'duration': media.duration
-            })
-
-    return render_template('display.html',
-                         media_list=json.dumps(media_list),
-                         screen_name=screen.name,
-                         screen_uuid=str(screen_uuid))
-
 @app.route('/screen/pair', methods=['POST'])
 def pair_screen():
     """Pair a screen using pairing code"""
@@ -1031,9 +1261,15 @@ def upload_screen_media(screen_id):
     if 'file' not in request.files:
         return jsonify({'success': False, 'error': 'Ingen fil valgt'}), 400
 
+    from media_processing import optimize_image, optimize_video
+
     files = request.files.getlist('file')
     uploaded_count = 0
 
+    # Allocate positions once for the whole batch
+    media_order = next_order_index(Media.order_index)
+    screen_order = next_order_index(ScreenMedia.order_index, ScreenMedia.screen_id == screen.id)
+
     for file in files:
         if file and allowed_file(file.filename):
             original_filename = file.filename
@@ -1042,6 +1278,7 @@ def upload_screen_media(screen_id):
 
             upload_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
             file.save(upload_path)
+            track_file('uploads', upload_path)
 
             ext = filename.rsplit('.', 1)[1].lower()
             is_video = ext in ['mp4', 'avi', 'mov', 'webm']
@@ -1067,24 +1304,30 @@ def upload_screen_media(screen_id):
                 original_filename=original_filename,
                 media_type=media_type,
                 duration=duration,
+                thumbnail=generate_thumbnail(optimized_filename, media_type),
+                file_size=track_file('optimized', optimized_path),
+                stream_playlist=package_video_stream(optimized_filename) if is_video else None,
+                source_filename=filename,
                 uploaded_by=current_user.id,
-                order_index=Media.query.count(),
+                order_index=media_order,
                 is_global=False  # Screen-specific media
             )
             db.session.add(media)
             db.session.flush()  # Get media.id
 
             # Assign to screen using ScreenMedia association
-            current_max_order = db.session.query(db.func.max(ScreenMedia.order_index)).filter_by(screen_id=screen_id).scalar() or -1
             assoc = ScreenMedia(
                 screen_id=screen_id,
                 media_id=media.id,
-                order_index=current_max_order + 1
+                order_index=screen_order
             )
             db.session.add(assoc)
+            media_order += 1
+            screen_order += 1
             uploaded_count += 1
 
     db.session.commit()
+    invalidate_display_pages(screen)
     return jsonify({'success': True, 'count': uploaded_count})
 
 @app.route('/screen/<int:screen_id>/settings', methods=['POST'])
@@ -1137,21 +1380,24 @@ def update_screen_settings(screen_id):
     if 'json_template' in data:
         screen.json_template = data['json_template']
 
+    if 'json_dedupe_key' in data:
+        screen.json_dedupe_key = data['json_dedupe_key'].strip() or None
+
     # Handle sponsor logo upload
     if 'sponsor_logo' in request.files:
         file = request.files['sponsor_logo']
         if file and file.filename:
-            # Create sponsors directory if it doesn't exist
             sponsors_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'sponsors')
-            os.makedirs(sponsors_dir, exist_ok=True)
 
             # Generate unique filename
             filename = secure_filename(file.filename)
             unique_filename = f"{screen.uuid}_sponsor_{filename}"
-            filepath = os.path.join(sponsors_dir, unique_filename)
 
-            # Save file
-            file.save(filepath)
+            # Remove the logo being replaced
+            remove_file('uploads', upload_url_to_path(screen.sponsor_logo_path))
+
+            # Save file resized to display size
+            unique_filename = save_logo(file, sponsors_dir, unique_filename, SPONSOR_LOGO_SIZE)
 
             # Update database with relative path
             screen.sponsor_logo_path = f"/uploads/sponsors/{unique_filename}"
@@ -1161,17 +1407,17 @@ def update_screen_settings(screen_id):
     if 'magion_logo' in request.files:
         file = request.files['magion_logo']
         if file and file.filename:
-            # Create logos directory if it doesn't exist
             logos_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'logos')
-            os.makedirs(logos_dir, exist_ok=True)
 
             # Generate unique filename
             filename = secure_filename(file.filename)
             unique_filename = f"{screen.uuid}_magion_{filename}"
-            filepath = os.path.join(logos_dir, unique_filename)
 
-            # Save file
-            file.save(filepath)
+            # Remove the logo being replaced
+            remove_file('uploads', upload_url_to_path(screen.magion_logo_path))
+
+            # Save file resized to display size
+            unique_filename = save_logo(file, logos_dir, unique_filename, MAGION_LOGO_SIZE)
 
             # Update database with relative path
             screen.magion_logo_path = f"/uploads/logos/{unique_filename}"
@@ -1185,6 +1431,7 @@ def update_screen_settings(screen_id):
         screen.carousel_speed = data['carousel_speed']
 
     db.session.commit()
+    invalidate_display_pages(screen)
 
     if request.is_json:
         return jsonify({'success': True})
@@ -1205,6 +1452,7 @@ def edit_screen(screen_id):
     screen.custom_url = request.form.get('custom_url', '')
 
     db.session.commit()
+    invalidate_display_pages(screen)
 
     flash(f'Skærmen "{screen.name}" er opdateret', 'success')
     return redirect(url_for('dashboard'))
@@ -1217,33 +1465,37 @@ def upload_carousel_sponsors(screen_id):
 
     files = request.files.getlist('carousel_sponsors')
     uploaded_count = 0
+    order_index = next_order_index(SponsorCarousel.order_index, SponsorCarousel.screen_id == screen.id)
 
     for file in files:
         if file and file.filename:
-            # Create carousel directory if it doesn't exist
             carousel_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'carousel')
-            os.makedirs(carousel_dir, exist_ok=True)
 
             # Generate unique filename
             timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
             filename = secure_filename(file.filename)
             unique_filename = f"{screen.uuid}_carousel_{timestamp}_{filename}"
-            filepath = os.path.join(carousel_dir, unique_filename)
 
-            # Save file
-            file.save(filepath)
+            # Save file resized to display size
+            unique_filename = save_logo(file, carousel_dir, unique_filename, CAROUSEL_LOGO_SIZE)
+            filepath = os.path.join(carousel_dir, unique_filename)
 
             # Create database entry
             sponsor = SponsorCarousel(
                 screen_id=screen.id,
                 filename=f"/uploads/carousel/{unique_filename}",
                 original_filename=file.filename,
-                order_index=SponsorCarousel.query.filter_by(screen_id=screen.id).count(),
-                uploaded_by=current_user.id
+                order_index=order_index,
+                uploaded_by=current_user.id,
+                file_size=os.path.getsize(filepath)
             )
             db.session.add(sponsor)
+            order_index += 1
             uploaded_count += 1
 
+    if uploaded_count:
+        rebuild_carousel_sprite(screen)
+
     db.session.commit()
     return jsonify({'success': True, 'count': uploaded_count})
 
@@ -1256,13 +1508,12 @@ def delete_carousel_sponsor(screen_id, sponsor_id):
 
     # Delete file from filesystem
     try:
-        file_path = os.path.join(app.root_path, sponsor.filename.lstrip('/'))
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        remove_file('uploads', upload_url_to_path(sponsor.filename))
     except Exception as e:
         logger.warning(f"Failed to delete carousel sponsor file: {e}")
 
     db.session.delete(sponsor)
+    rebuild_carousel_sprite(screen)
     db.session.commit()
 
     return jsonify({'success': True})
@@ -1278,6 +1529,7 @@ def delete_screen_route(screen_id):
     # Delete will cascade to ScreenMedia associations automatically
     db.session.delete(screen)
     db.session.commit()
+    invalidate_display_pages(screen)
 
     flash(f'Skærmen "{screen_name}" er slettet', 'success')
     return redirect(url_for('dashboard'))
@@ -1335,6 +1587,7 @@ def delete_user(user_id):
     username = user.username
     db.session.delete(user)
     db.session.commit()
+    invalidate_user(user_id)
 
     flash(f'Bruger "{username}" er slettet', 'success')
     return redirect(url_for('users'))
@@ -1360,8 +1613,12 @@ def change_password():
             flash('Password skal være mindst 4 tegn', 'error')
             return redirect(url_for('change_password'))
 
-        current_user.password_hash = generate_password_hash(new_password)
+        # current_user is the shared cached copy - change the row through the session instead
+        user = db.session.get(User, current_user.id)
+        user.password_hash = generate_password_hash(new_password)
         db.session.commit()
+        invalidate_user(user.id)
+        login_user(user)  # New session id with the new password version, other sessions end
 
         flash('Password er ændret', 'success')
         return redirect(url_for('dashboard'))
@@ -1376,6 +1633,106 @@ def login_history():
     logs = LoginLog.query.order_by(LoginLog.login_time.desc()).limit(100).all()
     return render_template('login_history.html', logs=logs)
 
+# ========== BROADCASTS ==========
+
+BROADCAST_IMAGE_SIZE = (1920, 1080)
+BROADCAST_HISTORY_DAYS = 7  # Expired broadcasts (and their images) are deleted after this
+
+@app.route('/broadcasts')
+@login_required
+def broadcasts():
+    """Publish and cancel broadcast overrides"""
+    recent = Broadcast.query.order_by(Broadcast.id.desc()).limit(50).all()
+    screens = Screen.query.order_by(Screen.name).all()
+    screen_names = {screen.uuid: screen.name for screen in screens}
+    return render_template('broadcasts.html', broadcasts=recent, screens=screens, screen_names=screen_names,
+                           now=datetime.utcnow())
+
+@app.route('/broadcasts', methods=['POST'])
+@login_required
+def create_broadcast():
+    """Publish a broadcast - reaches connected screens within about a second"""
+    message = request.form.get('message', '').strip()
+    url = request.form.get('url', '').strip()
+    try:
+        minutes = max(1, min(int(request.form.get('minutes', 10)), 24 * 60))
+    except ValueError:
+        minutes = 10
+
+    image_path = None
+    file = request.files.get('image')
+    if file and file.filename:
+        filename = f"{int(time.time())}_{secure_filename(file.filename)}"
+        filename = save_logo(file, os.path.join(app.config['UPLOAD_FOLDER'], 'broadcasts'), filename, BROADCAST_IMAGE_SIZE)
+        image_path = f"/uploads/broadcasts/{filename}"
+
+    if not (message or url or image_path):
+        flash('Skriv en besked, vælg et billede eller angiv en URL', 'error')
+        return redirect(url_for('broadcasts'))
+
+    broadcast = Broadcast(
+        message=message,
+        image_path=image_path,
+        url=url,
+        target_screens=','.join(request.form.getlist('screens')),
+        expires_at=datetime.utcnow() + timedelta(minutes=minutes),
+        created_by=current_user.id
+    )
+    db.session.add(broadcast)
+    prune_broadcasts()
+    db.session.commit()
+    notify_broadcasts()
+
+    logger.info(f"Broadcast {broadcast.id} published by {current_user.username} for {minutes} min")
+    flash(f'Broadcast sendt - vises i {minutes} minutter', 'success')
+    return redirect(url_for('broadcasts'))
+
+@app.route('/broadcasts/<int:broadcast_id>/cancel', methods=['POST'])
+@login_required
+def cancel_broadcast(broadcast_id):
+    """Take a broadcast off the screens before it expires"""
+    broadcast = Broadcast.query.get_or_404(broadcast_id)
+    broadcast.cancelled = True
+    db.session.commit()
+    notify_broadcasts()
+    flash('Broadcast stoppet', 'success')
+    return redirect(url_for('broadcasts'))
+
+def prune_broadcasts():
+    """Delete broadcasts that expired more than BROADCAST_HISTORY_DAYS ago, with their images"""
+    cutoff = datetime.utcnow() - timedelta(days=BROADCAST_HISTORY_DAYS)
+    for broadcast in Broadcast.query.filter(Broadcast.expires_at < cutoff).all():
+        remove_file('uploads', upload_url_to_path(broadcast.image_path))
+        db.session.delete(broadcast)
+
+@app.route('/profiles')
+@login_required
+@admin_required
+def profiles():
+    """Stored request profiles (Admin only)"""
+    return render_template('profiles.html', profiles=list_profiles(), sample_rate=PROFILE_SAMPLE_RATE,
+                           keep=PROFILE_KEEP)
+
+@app.route('/profiles/<profile_id>')
+@login_required
+@admin_required
+def profile_detail(profile_id):
+    """One request profile - functions by cumulative time and its SQL statements"""
+    profile = load_profile(profile_id)
+    if not profile:
+        flash('Profilen findes ikke længere', 'error')
+        return redirect(url_for('profiles'))
+    return render_template('profile_detail.html', profile=profile)
+
+@app.route('/profiles/<profile_id>/download')
+@login_required
+@admin_required
+def download_profile(profile_id):
+    """Raw cProfile data for snakeviz/pstats"""
+    if not load_profile(profile_id):
+        return jsonify({'error': 'Profile not found'}), 404
+    return send_from_directory(PROFILE_FOLDER, f'{profile_id}.prof', as_attachment=True)
+
 @app.route('/settings', methods=['GET', 'POST'])
 @login_required
 @admin_required
@@ -1394,35 +1751,94 @@ def settings_page():
                 db.session.add(new_setting)
 
         db.session.commit()
+        invalidate_display_pages()
         flash('Indstillinger gemt', 'success')
         return redirect(url_for('settings_page'))
 
     all_settings = Settings.query.all()
     return render_template('settings.html', settings=all_settings)
 
+def setup_media_fts():
+    """Create the FTS5 filename index and the triggers that keep it in sync with media (SQLite only)"""
+    global MEDIA_FTS_ENABLED
+    if db.engine.dialect.name != 'sqlite':
+        return
+
+    from sqlalchemy import text
+    try:
+        with db.engine.connect() as conn:
+            exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type='table' AND name='media_fts'")).scalar()
+            if not exists:
+                conn.execute(text("CREATE VIRTUAL TABLE media_fts USING fts5(original_filename, content='media', content_rowid='id')"))
+                conn.execute(text("INSERT INTO media_fts(media_fts) VALUES('rebuild')"))
+                logger.info("Created media_fts full-text index")
+
+            conn.execute(text("""
+                CREATE TRIGGER IF NOT EXISTS media_fts_insert AFTER INSERT ON media BEGIN
+                    INSERT INTO media_fts(rowid, original_filename) VALUES (new.id, new.original_filename);
+                END"""))
+            conn.execute(text("""
+                CREATE TRIGGER IF NOT EXISTS media_fts_delete AFTER DELETE ON media BEGIN
+                    INSERT INTO media_fts(media_fts, rowid, original_filename) VALUES ('delete', old.id, old.original_filename);
+                END"""))
+            conn.execute(text("""
+                CREATE TRIGGER IF NOT EXISTS media_fts_update AFTER UPDATE OF original_filename ON media BEGIN
+                    INSERT INTO media_fts(media_fts, rowid, original_filename) VALUES ('delete', old.id, old.original_filename);
+                    INSERT INTO media_fts(rowid, original_filename) VALUES (new.id, new.original_filename);
+                END"""))
+            conn.commit()
+        MEDIA_FTS_ENABLED = True
+    except Exception as e:
+        logger.warning(f"Full-text search unavailable, falling back to LIKE: {e}")
+
 def init_db():
     """Initialize database with default admin user"""
     with app.app_context():
         db.create_all()
 
-        # Enable WAL mode for better concurrency and performance
+        # Log the effective database profile (SQLite pragmas are applied per connection)
         try:
             from sqlalchemy import text
-            with db.engine.connect() as conn:
-                result = conn.execute(text("PRAGMA journal_mode=WAL;"))
-                mode = result.scalar()
-                conn.commit()
-                logger.info(f"SQLite journal mode: {mode}")
+            if db.engine.dialect.name == 'sqlite':
+                with db.engine.connect() as conn:
+                    mode = conn.execute(text("PRAGMA journal_mode;")).scalar()
+                    synchronous = conn.execute(text("PRAGMA synchronous;")).scalar()
+                    busy_timeout = conn.execute(text("PRAGMA busy_timeout;")).scalar()
+                logger.info(f"SQLite journal mode: {mode}, synchronous: {synchronous}, busy_timeout: {busy_timeout}ms")
+            else:
+                logger.info(f"Database backend: {db.engine.dialect.name} (pool size {db.engine.pool.size()})")
         except Exception as e:
-            logger.warning(f"Failed to enable WAL mode: {e}")
+            logger.warning(f"Failed to read database profile: {e}")
 
-        # Add new columns to Screen table if they don't exist (migration)
+        # Add new columns to Screen and Media tables if they don't exist (migration)
         try:
             from sqlalchemy import inspect, text
             inspector = inspect(db.engine)
             screen_columns = [col['name'] for col in inspector.get_columns('screen')]
+            media_columns = [col['name'] for col in inspector.get_columns('media')]
+            carousel_columns = [col['name'] for col in inspector.get_columns('sponsor_carousel')]
 
             with db.engine.connect() as conn:
+                if 'thumbnail' not in media_columns:
+                    conn.execute(text("ALTER TABLE media ADD COLUMN thumbnail VARCHAR(200)"))
+                    logger.info("Added thumbnail column to media table")
+
+                if 'source_filename' not in media_columns:
+                    conn.execute(text("ALTER TABLE media ADD COLUMN source_filename VARCHAR(200)"))
+                    logger.info("Added source_filename column to media table")
+
+                if 'file_size' not in media_columns:
+                    conn.execute(text("ALTER TABLE media ADD COLUMN file_size BIGINT"))
+                    logger.info("Added file_size column to media table")
+
+                if 'stream_playlist' not in media_columns:
+                    conn.execute(text("ALTER TABLE media ADD COLUMN stream_playlist VARCHAR(200)"))
+                    logger.info("Added stream_playlist column to media table")
+
+                if 'file_size' not in carousel_columns:
+                    conn.execute(text("ALTER TABLE sponsor_carousel ADD COLUMN file_size BIGINT"))
+                    logger.info("Added file_size column to sponsor_carousel table")
+
                 if 'display_mode' not in screen_columns:
                     conn.execute(text("ALTER TABLE screen ADD COLUMN display_mode VARCHAR(20) DEFAULT 'media'"))
                     logger.info("Added display_mode column to screen table")
@@ -1447,6 +1863,10 @@ def init_db():
                     conn.execute(text("ALTER TABLE screen ADD COLUMN json_template VARCHAR(50) DEFAULT 'schedule'"))
                     logger.info("Added json_template column to screen table")
 
+                if 'json_dedupe_key' not in screen_columns:
+                    conn.execute(text("ALTER TABLE screen ADD COLUMN json_dedupe_key VARCHAR(100)"))
+                    logger.info("Added json_dedupe_key column to screen table")
+
                 if 'sponsor_logo_path' not in screen_columns:
                     conn.execute(text("ALTER TABLE screen ADD COLUMN sponsor_logo_path VARCHAR(500)"))
                     logger.info("Added sponsor_logo_path column to screen table")
@@ -1456,13 +1876,21 @@ def init_db():
                     logger.info("Added magion_logo_path column to screen table")
 
                 if 'carousel_enabled' not in screen_columns:
-                    conn.execute(text("ALTER TABLE screen ADD COLUMN carousel_enabled BOOLEAN DEFAULT 0"))
+                    conn.execute(text("ALTER TABLE screen ADD COLUMN carousel_enabled BOOLEAN DEFAULT FALSE"))
                     logger.info("Added carousel_enabled column to screen table")
 
                 if 'carousel_speed' not in screen_columns:
                     conn.execute(text("ALTER TABLE screen ADD COLUMN carousel_speed VARCHAR(20) DEFAULT 'medium'"))
                     logger.info("Added carousel_speed column to screen table")
 
+                if 'carousel_sprite_path' not in screen_columns:
+                    conn.execute(text("ALTER TABLE screen ADD COLUMN carousel_sprite_path VARCHAR(500)"))
+                    logger.info("Added carousel_sprite_path column to screen table")
+
+                if 'carousel_sprite_map' not in screen_columns:
+                    conn.execute(text("ALTER TABLE screen ADD COLUMN carousel_sprite_map TEXT"))
+                    logger.info("Added carousel_sprite_map column to screen table")
+
                 # IP tracking and admin fields
                 if 'last_access_ip' not in screen_columns:
                     conn.execute(text("ALTER TABLE screen ADD COLUMN last_access_ip VARCHAR(50)"))
@@ -1473,7 +1901,7 @@ def init_db():
                     logger.info("Added last_access_lan_ip column to screen table")
 
                 if 'last_access_time' not in screen_columns:
-                    conn.execute(text("ALTER TABLE screen ADD COLUMN last_access_time DATETIME"))
+                    conn.execute(text("ALTER TABLE screen ADD COLUMN last_access_time TIMESTAMP"))
                     logger.info("Added last_access_time column to screen table")
 
                 if 'admin_notes' not in screen_columns:
@@ -1488,6 +1916,16 @@ def init_db():
         except Exception as e:
             logger.warning(f"Migration warning (columns may already exist): {e}")
 
+        setup_media_fts()
+
+        # Ordering indexes (create_all only adds them to new tables)
+        try:
+            for table in (Media.__table__, ScreenMedia.__table__, SponsorCarousel.__table__):
+                for index in table.indexes:
+                    index.create(bind=db.engine, checkfirst=True)
+        except Exception as e:
+            logger.warning(f"Index migration warning: {e}")
+
         # Create default admin user if not exists
         admin_username = os.environ.get('ADMIN_USERNAME', 'admin')
         admin_password = os.environ.get('ADMIN_PASSWORD', 'magion2024')
@@ -1534,6 +1972,96 @@ def init_db():
         # Import existing media if available
         import_existing_media()
 
+        # Seed the storage counters with a full scan the first time
+        try:
+            if StorageUsage.query.count() < len(STORAGE_AREAS):
+                reconcile_storage()
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"Storage accounting initialization warning: {e}")
+
+    # Static assets are only rewritten when the source is newer than its .gz/.br
+    precompress_static(app.static_folder)
+
+@app.cli.command('compress-static')
+def compress_static_command():
+    """Write precompressed .gz/.br variants of static CSS/JS"""
+    logger.info(f"{precompress_static(app.static_folder)} static files compressed")
+
+@app.cli.command('reconcile-storage')
+def reconcile_storage_command():
+    """Rescan upload/optimized folders and reset the disk usage counters"""
+    reconcile_storage()
+    for usage in StorageUsage.query.all():
+        logger.info(f"{usage.area}: {usage.count} files, {usage.size / (1024 * 1024):.1f} MB")
+
+@app.cli.command('storage-gc')
+@click.option('--dry-run', is_flag=True, help='Only report what would be deleted')
+def storage_gc_command(dry_run):
+    """Delete orphaned files and enforce STORAGE_QUOTA_MB"""
+    report = run_storage_gc(dry_run=dry_run)
+    for orphan in report['orphans']:
+        logger.info(f"{'Would delete' if dry_run else 'Orphan'}: {orphan['path']} ({orphan['size']} bytes)")
+    for media in report['evictions']:
+        logger.info(f"{'Would evict' if dry_run else 'Evicted'}: {media['original_filename']}")
+    logger.info(f"{report['orphan_count']} orphaned files, {report['orphan_bytes'] / (1024 * 1024):.1f} MB")
+
+@app.cli.command('rebuild-sprites')
+def rebuild_sprites_command():
+    """Regenerate the carousel sprite sheet for every screen with carousel logos"""
+    screens = Screen.query.filter(Screen.carousel_sponsors.any()).all()
+    for screen in screens:
+        rebuild_carousel_sprite(screen)
+        db.session.commit()
+        logger.info(f"Carousel sprite for {screen.name}: {screen.carousel_sprite_path}")
+
+@app.cli.command('backfill-thumbnails')
+def backfill_thumbnails_command():
+    """Generate thumbnails/poster frames for existing media without one"""
+    missing = Media.query.filter(Media.thumbnail.is_(None)).order_by(Media.id).all()
+    logger.info(f"Generating thumbnails for {len(missing)} media files...")
+
+    created = 0
+    for index, media in enumerate(missing, start=1):
+        if not os.path.exists(os.path.join(app.config['OPTIMIZED_FOLDER'], media.filename)):
+            continue
+        media.thumbnail = generate_thumbnail(media.filename, media.media_type)
+        if media.thumbnail:
+            created += 1
+        # Commit in small batches so progress survives an interrupted run
+        if index % 50 == 0:
+            db.session.commit()
+
+    db.session.commit()
+    logger.info(f"Thumbnail backfill complete: {created} created, {len(missing) - created} skipped")
+
+@app.cli.command('package-videos')
+def package_videos_command():
+    """Remux existing videos for fast start and package HLS segments where VIDEO_PACKAGING=hls"""
+    from media_processing import remux_faststart
+    videos = Media.query.filter_by(media_type='video').order_by(Media.id).all()
+    logger.info(f"Packaging {len(videos)} videos...")
+
+    remuxed = packaged = 0
+    for media in videos:
+        video_path = os.path.join(app.config['OPTIMIZED_FOLDER'], media.filename)
+        if not os.path.exists(video_path):
+            continue
+        old_size = os.path.getsize(video_path)
+        if remux_faststart(video_path, video_path):
+            media.file_size = os.path.getsize(video_path)
+            adjust_storage('optimized', media.file_size - old_size, 0)
+            remuxed += 1
+        if not media.stream_playlist:
+            media.stream_playlist = package_video_stream(media.filename)
+            packaged += 1 if media.stream_playlist else 0
+        # Commit per video so progress survives an interrupted run
+        db.session.commit()
+
+    if remuxed or packaged:
+        invalidate_display_pages()
+    logger.info(f"Video packaging complete: {remuxed} remuxed for fast start, {packaged} packaged as HLS")
+
 def import_existing_media():
     """Import existing media files if they exist"""
     media_list_path = '/app/media_list.json'
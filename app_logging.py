@@ -0,0 +1,183 @@
+"""
+Logging setup - non-blocking queue handler, JSON lines and rate-limited screen events
+
+configure_logging() replaces logging.basicConfig(): records go through a bounded queue to a
+listener thread that formats and writes them, so a request never waits for stdout. Messages
+are formatted in the listener (lazy %-args), which means args must be plain values - pass
+screen.name, not the ORM object.
+
+log_event() is for the repetitive per-screen lines (page loads, display mode, LAN IP reports).
+Each event type has an interval (EVENT_LOG_INTERVALS, overridable with LOG_EVENT_INTERVALS=
+"screen.access=60,screen.mode=0"): within it only the first event per key (screen) is logged,
+the rest are counted and reported in one summary line when the interval is over.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')  # 'json' or 'text'
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))  # Records beyond this are dropped and counted
+EVENT_LOG_INTERVALS = {'screen.access': 60, 'screen.mode': 300, 'screen.lan_ip': 300}  # Seconds, 0 = log every event
+EVENT_SUMMARY_TOP = 5
+log_listener = None
+
+def parse_event_intervals(value):
+    """'screen.access=60,screen.mode=0' -> {'screen.access': 60, 'screen.mode': 0}"""
+    intervals = {}
+    for part in (value or '').split(','):
+        name, _, seconds = part.partition('=')
+        if name.strip() and seconds.strip():
+            intervals[name.strip()] = float(seconds)
+    return intervals
+
+EVENT_LOG_INTERVALS.update(parse_event_intervals(os.environ.get('LOG_EVENT_INTERVALS')))
+
+class LazyMessage:
+    """str.format template rendered only when the record is written"""
+    __slots__ = ('template', 'fields')
+
+    def __init__(self, template, fields):
+        self.template = template
+        self.fields = fields
+
+    def __str__(self):
+        return self.template.format(**self.fields)
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line - event records carry their fields as top-level keys"""
+    def format(self, record):
+        entry = {
+            'ts': datetime.utcfromtimestamp(record.created).isoformat(timespec='milliseconds') + 'Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        event = getattr(record, 'event', None)
+        if event:
+            entry['event'] = event
+            entry.update(getattr(record, 'fields', {}))
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks or formats in the request thread"""
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Tracebacks must be rendered while they exist; everything else is formatted by the listener
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            try:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                    'msg': 'Log queue full - dropped %d records', 'args': (dropped,)}))
+            except queue.Full:
+                self.dropped += dropped
+
+def configure_logging():
+    """Route the root logger through the log queue (once per process)"""
+    global log_listener
+    if log_listener:
+        return
+    stream = logging.StreamHandler()
+    stream.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else logging.Formatter(logging.BASIC_FORMAT))
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    log_listener = QueueListener(log_queue, stream, respect_handler_level=True)
+    log_listener.start()
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(NonBlockingQueueHandler(log_queue))
+    root.setLevel(LOG_LEVEL)
+    atexit.register(shutdown_logging)
+
+def shutdown_logging():
+    """Write the pending event summaries and drain the queue"""
+    global log_listener
+    event_log.flush_all()
+    if log_listener:
+        log_listener.stop()
+        log_listener = None
+
+class EventLog:
+    """Per event type: log the first event per key in each interval, summarise the rest"""
+    def __init__(self):
+        self.windows = {}  # event -> {'started', 'counts', 'logger'}
+        self.lock = threading.Lock()
+
+    def log(self, logger, event, key, message, fields, level):
+        interval = EVENT_LOG_INTERVALS.get(event, 0)
+        if interval <= 0:
+            logger.log(level, LazyMessage(message, fields), extra={'event': event, 'fields': fields})
+            return
+
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows.get(event)
+            finished = None
+            if window and now - window['started'] >= interval:
+                finished = self.windows.pop(event)
+                window = None
+            if not window:
+                window = self.windows[event] = {'started': now, 'counts': {}, 'logger': logger}
+            count = window['counts'].get(key, 0)
+            window['counts'][key] = count + 1
+
+        if finished:
+            self.summarize(event, finished, now)
+        if not count:
+            logger.log(level, LazyMessage(message, fields), extra={'event': event, 'fields': fields})
+
+    def summarize(self, event, window, now):
+        counts = window['counts']
+        total = sum(counts.values())
+        if total <= len(counts):
+            return  # Every event was logged individually
+        top = sorted(counts.items(), key=lambda item: item[1], reverse=True)[:EVENT_SUMMARY_TOP]
+        fields = {
+            'summary_of': event,
+            'count': total,
+            'keys': len(counts),
+            'suppressed': total - len(counts),
+            'seconds': round(now - window['started']),
+            'top': {str(key): count for key, count in top},
+        }
+        window['logger'].info(
+            LazyMessage('{summary_of}: {count} events from {keys} screens in {seconds}s ({suppressed} not logged)', fields),
+            extra={'event': f'{event}.summary', 'fields': fields})
+
+    def flush_all(self):
+        now = time.monotonic()
+        with self.lock:
+            windows, self.windows = self.windows, {}
+        for event, window in windows.items():
+            self.summarize(event, window, now)
+
+event_log = EventLog()
+
+def log_event(logger, event, key, message, level=logging.INFO, **fields):
+    """Rate-limited structured log line - message is a str.format template over fields"""
+    if logger.isEnabledFor(level):
+        event_log.log(logger, event, key, message, fields, level)
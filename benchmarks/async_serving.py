@@ -0,0 +1,190 @@
+"""
+Player serving mode load test - sync vs gevent gunicorn workers
+
+Starts the read-only player service (player:create_app()) under gunicorn once per worker
+class and opens --connections concurrent screen clients against it. Half the clients poll
+/api/screen/<uuid>/json-data for a screen whose upstream feed answers slowly (the worst case:
+JSON_FEED_TTL=0, every poll goes upstream), the other half load /screen/<uuid> for a media
+screen. Reports how many connections were in flight at once, p50/p99 latency per endpoint,
+errors and the RSS of the gunicorn processes:
+
+    python benchmarks/async_serving.py
+    python benchmarks/async_serving.py --connections 2000 --upstream-delay 2 --modes gevent
+
+Options: --connections 500 --duration 15 --workers 4 --upstream-delay 1.0 --json-screens 50 --modes sync gevent
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def start_upstream(delay):
+    """Stub booking feed that takes `delay` seconds to answer"""
+    body = json.dumps({'infoskaerm': [
+        {'Titel': f'Booking {i}', 'FraTid': '23:00', 'TilTid': '23:59', 'Sted': 'Hal 1'} for i in range(20)
+    ]}).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    ThreadingHTTPServer.request_queue_size = 1024
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def seed(database_url, feed_url, json_screens):
+    """Create json_api screens (each with its own feed URL) and one media screen through the admin app"""
+    code = (
+        "import app_docker as a\n"
+        "with a.app.app_context():\n"
+        f"    screens = [a.Screen(name=f'bench-json-{{i}}', display_mode='json_api', json_api_url=f'{feed_url}?s={{i}}')\n"
+        f"               for i in range({json_screens})]\n"
+        "    screens.append(a.Screen(name='bench-media'))\n"
+        "    a.db.session.add_all(screens); a.db.session.commit()\n"
+        "    print(' '.join(s.uuid for s in screens))\n"
+    )
+    env = dict(os.environ, DATABASE_URL=database_url)
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    uuids = output.stdout.strip().splitlines()[-1].split()
+    return uuids[:-1], uuids[-1]
+
+
+def start_player(mode, port, workers, connections, env):
+    command = ['gunicorn', '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--timeout', '120',
+               '--backlog', '4096', '--worker-class', mode, '--log-level', 'warning']
+    if mode == 'gevent':
+        command += ['--worker-connections', str(max(connections, 1000))]
+    process = subprocess.Popen(command + ['player:create_app()'], cwd=ROOT, env=env)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            import urllib.request
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/health', timeout=1).read()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f'gunicorn ({mode}) did not start')
+
+
+def rss_mb(pid):
+    """RSS of the gunicorn master and its workers"""
+    total = 0
+    pids = [pid] + [int(p) for p in subprocess.run(['pgrep', '-P', str(pid)], capture_output=True, text=True).stdout.split()]
+    for p in pids:
+        try:
+            with open(f'/proc/{p}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+        except OSError:
+            pass
+    return total / 1024
+
+
+async def client(port, path, stop_at, results, in_flight):
+    """One screen: request, wait for the answer, repeat until the test ends"""
+    while time.time() < stop_at:
+        start = time.perf_counter()
+        try:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight[1], in_flight[0])
+            reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout=60)
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n'.encode())
+            await writer.drain()
+            response = await asyncio.wait_for(reader.read(), timeout=120)
+            writer.close()
+            status = int(response.split(b' ', 2)[1]) if response else 0
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+            status = 0
+        finally:
+            in_flight[0] -= 1
+        results.append((time.perf_counter() - start, status))
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def run_load(port, paths, connections, duration):
+    stop_at = time.time() + duration
+    in_flight = [0, 0]
+    results = {path: [] for path in set(paths)}
+    tasks = [client(port, paths[i % len(paths)], stop_at, results[paths[i % len(paths)]], in_flight)
+             for i in range(connections)]
+    await asyncio.gather(*tasks)
+    return results, in_flight[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--connections', type=int, default=500)
+    parser.add_argument('--duration', type=float, default=15.0)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--upstream-delay', type=float, default=1.0)
+    parser.add_argument('--modes', nargs='+', default=['sync', 'gevent'])
+    parser.add_argument('--json-screens', type=int, default=50, help='json_api screens, each with its own slow feed')
+    parser.add_argument('--port', type=int, default=45790)
+    args = parser.parse_args()
+
+    upstream = start_upstream(args.upstream_delay)
+    feed_url = f'http://127.0.0.1:{upstream.server_port}/feed.json'
+    workdir = tempfile.mkdtemp(prefix='magion-async-')
+    database_url = f'sqlite:///{workdir}/bench.db'
+    json_uuids, media_uuid = seed(database_url, feed_url, args.json_screens)
+    paths = [f'/api/screen/{uuid}/json-data' for uuid in json_uuids] + [f'/screen/{media_uuid}'] * len(json_uuids)
+
+    env = dict(os.environ, DATABASE_URL=database_url, JSON_FEED_TTL='0', JSON_FEED_WORKERS='100',
+               DISPLAY_CACHE_FOLDER=os.path.join(workdir, 'display_cache'))
+
+    print(f"connections: {args.connections}  workers: {args.workers}  duration: {args.duration}s  "
+          f"upstream delay: {args.upstream_delay}s")
+    for mode in args.modes:
+        process = start_player(mode, args.port, args.workers, args.connections, env)
+        try:
+            results, peak = asyncio.run(run_load(args.port, paths, args.connections, args.duration))
+            memory = rss_mb(process.pid)
+        finally:
+            process.terminate()
+            process.wait()
+
+        print(f"\n{mode}: peak concurrent connections {peak}  RSS {memory:.0f}MB")
+        grouped = {'json-data': [], 'display': []}
+        for path, samples in results.items():
+            grouped['json-data' if path.endswith('json-data') else 'display'].extend(samples)
+        for label, samples in grouped.items():
+            latencies = sorted(s[0] * 1000 for s in samples)
+            errors = sum(1 for s in samples if s[1] != 200)
+            if not latencies:
+                print(f"  {label:10} no requests completed")
+                continue
+            print(f"  {label:10} {len(samples) / args.duration:8.1f} req/s  "
+                  f"p50 {statistics.median(latencies):8.1f}ms  p99 {percentile(latencies, 0.99):8.1f}ms  "
+                  f"errors {errors}")
+    upstream.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Compression benchmark - bytes on the wire per page with and without content negotiation
+
+Logs in with the test client and fetches the dashboard, the JSON APIs and the static
+assets three times each: no Accept-Encoding, gzip and br. Prints the transferred size and
+the time spent producing each response:
+
+    DATABASE_URL=sqlite:////tmp/bench.db python benchmarks/compression.py
+
+Set COMPRESS_MIN_SIZE / COMPRESS_LEVEL to compare settings.
+"""
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import player  # noqa: E402
+from app_docker import app, Screen  # noqa: E402
+
+ENCODINGS = [('identity', ''), ('gzip', 'gzip'), ('br', 'br, gzip')]
+
+
+def measure(client, path):
+    row = []
+    for _, accept in ENCODINGS:
+        start = time.perf_counter()
+        response = client.get(path, headers={'Accept-Encoding': accept} if accept else {})
+        elapsed = time.perf_counter() - start
+        size = len(response.get_data())
+        response.close()
+        row.append((size, elapsed, response.headers.get('Content-Encoding', '-'), response.status_code))
+    return row
+
+
+def main():
+    logging.getLogger().setLevel(os.environ.get('BENCH_LOG_LEVEL', 'WARNING'))
+    player.precompress_static(app.static_folder)
+
+    client = app.test_client()
+    client.post('/login', data={'username': os.environ.get('ADMIN_USERNAME', 'admin'),
+                                'password': os.environ.get('ADMIN_PASSWORD', 'magion2024')})
+    with app.app_context():
+        screen = Screen.query.first()
+        screen_paths = [f'/screen/{screen.uuid}', f'/api/screen/{screen.uuid}/settings'] if screen else []
+
+    paths = ['/dashboard', '/api/media-list', '/api/cache-info', '/api/media-library',
+             '/static/css/style.css', '/static/sw.js'] + screen_paths
+
+    print(f"{'path':44} {'identity':>10} {'gzip':>10} {'br':>10}   saved")
+    total = [0, 0, 0]
+    for path in paths:
+        row = measure(client, path)
+        if row[0][3] != 200:
+            print(f"{path:44} HTTP {row[0][3]}")
+            continue
+        for index, (size, _, _, _) in enumerate(row):
+            total[index] += size
+        saved = 100 - 100 * row[2][0] / row[0][0] if row[0][0] else 0
+        timings = ' '.join(f"{elapsed * 1000:.1f}ms" for _, elapsed, _, _ in row)
+        print(f"{path:44} {row[0][0]:>10} {row[1][0]:>10} {row[2][0]:>10}   {saved:4.0f}%  ({timings})")
+    print(f"{'total':44} {total[0]:>10} {total[1]:>10} {total[2]:>10}")
+
+
+if __name__ == '__main__':
+    main()
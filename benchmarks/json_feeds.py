@@ -0,0 +1,103 @@
+"""
+JSON feed aggregation benchmark - concurrent multi-feed fetch against a local stub server
+
+Starts a stub HTTP server with several booking feeds (overlapping bookings, one slow feed
+and one broken feed) and measures how long a merged refresh takes, how many activities
+survive deduplication, and that cached refreshes do not hit upstream again:
+
+    python benchmarks/json_feeds.py
+    JSON_FEED_TIMEOUT=2 python benchmarks/json_feeds.py --feeds 6 --slow 5
+
+Options: --feeds 4 --slow 3 --activities 50
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import player  # noqa: E402
+
+hits = {}
+
+
+def make_activities(feed, count):
+    """Bookings for one feed - every other booking is also present in the next feed"""
+    activities = []
+    for index in range(count):
+        owner = feed if index % 2 else feed // 2 * 2
+        activities.append({
+            'Titel': f'Booking {owner}-{index}',
+            'FraTid': f'{23 - index % 3:02d}:{index % 60:02d}',
+            'TilTid': '23:59',
+            'Sted': f'Hal {index % 4 + 1}',
+            'Bruger': f'Forening {owner}',
+        })
+    return activities
+
+
+def make_handler(feeds, slow_seconds):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            hits[self.path] = hits.get(self.path, 0) + 1
+            if self.path == '/slow.json':
+                time.sleep(slow_seconds)
+            if self.path == '/broken.json':
+                self.send_response(500)
+                self.end_headers()
+                return
+            feed = feeds.get(self.path, [])
+            body = json.dumps({'infoskaerm': feed}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--feeds', type=int, default=4)
+    parser.add_argument('--slow', type=float, default=3.0, help='Seconds the slow feed takes to answer')
+    parser.add_argument('--activities', type=int, default=50)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(os.environ.get('BENCH_LOG_LEVEL', 'ERROR'))
+
+    feeds = {f'/feed{i}.json': make_activities(i, args.activities) for i in range(args.feeds)}
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(feeds, args.slow))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_port}'
+
+    urls = [base + path for path in feeds] + [f'{base}/slow.json', f'{base}/broken.json']
+    raw_count = sum(len(feed) for feed in feeds.values())
+
+    start = time.perf_counter()
+    activities, data_hash = player.get_json_feed(urls, 'schedule')
+    cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, cached_hash = player.get_json_feed(urls, 'schedule')
+    warm = time.perf_counter() - start
+
+    print(f"Feeds: {len(urls)} ({args.feeds} ok, 1 slow {args.slow}s, 1 broken)  "
+          f"timeout: {player.JSON_FEED_TIMEOUT}s  TTL: {player.JSON_FEED_TTL}s")
+    print(f"cold refresh   {cold * 1000:8.1f}ms  activities {len(activities)} of {raw_count} (after dedupe)")
+    print(f"cached refresh {warm * 1000:8.1f}ms  hash unchanged: {cached_hash == data_hash}")
+    print(f"upstream hits  {sum(count for path, count in hits.items() if path.startswith('/feed'))} "
+          f"for {args.feeds} feeds")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
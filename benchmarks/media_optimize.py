@@ -0,0 +1,361 @@
+"""
+Media optimisation benchmark - optimize_image / optimize_video on a synthetic corpus
+
+Generates test images (RGB/L/CMYK JPEG, RGBA PNG, P PNG with transparency, P GIF at several
+sizes) and short videos (H.264, MPEG-4 and VP9 at several resolutions, with audio) in a temp
+directory, then runs each case in a fresh Python process so imports and earlier cases don't
+skew the numbers. Per case: wall time, CPU time (including the ffmpeg children), peak RSS,
+output size, and output quality as SSIM/PSNR against a lossless reference with the same
+letterboxing (images) or the source frames (videos).
+
+Save a baseline, then compare a change against it - exits 1 on a regression beyond the
+thresholds:
+
+    python benchmarks/media_optimize.py --output baseline.json
+    python benchmarks/media_optimize.py --baseline baseline.json --output after.json
+    python benchmarks/media_optimize.py --quick --cases cmyk rgba
+
+Options: --repeat 3 --video-seconds 3 --threshold 0.2 --min-delta 0.05
+         --ssim-tolerance 0.005 --psnr-tolerance 0.5 --quick --cases <substring> ...
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+IMAGE_SIZES = {'small': (800, 600), 'hd': (1920, 1080), 'photo': (4032, 3024), 'panorama': (8000, 2000)}
+IMAGE_FORMATS = ['rgb-jpeg', 'l-jpeg', 'cmyk-jpeg', 'rgba-png', 'p-png', 'p-gif']
+VIDEO_CASES = [
+    ('h264-360p', (640, 360), 'libx264', 'mp4', 'aac'),
+    ('h264-720p', (1280, 720), 'libx264', 'mp4', 'aac'),
+    ('h264-1080p', (1920, 1080), 'libx264', 'mp4', 'aac'),
+    ('h264-2160p', (3840, 2160), 'libx264', 'mp4', 'aac'),
+    ('mpeg4-720p', (1280, 720), 'mpeg4', 'mov', 'aac'),
+    ('vp9-720p', (1280, 720), 'libvpx-vp9', 'webm', 'libopus'),
+]
+QUICK_SKIP = ('photo', 'panorama', '2160p')
+
+# Metric -> (higher is worse, kind of threshold)
+METRICS = {
+    'wall_s': (True, 'relative'),
+    'cpu_s': (True, 'relative'),
+    'peak_rss_mb': (True, 'relative'),
+    'output_bytes': (True, 'relative'),
+    'ssim': (False, 'ssim'),
+    'psnr_db': (False, 'psnr'),
+}
+
+
+# ========== CORPUS ==========
+
+def synthetic_photo(width, height, seed):
+    """Gradients, soft shapes and sensor noise - compresses roughly like a photo"""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    channels = []
+    for c in range(3):
+        fx, fy = rng.uniform(1, 6, 2)
+        channel = 128 + 60 * np.sin(x / width * fx * np.pi + c) * np.cos(y / height * fy * np.pi)
+        for _ in range(6):
+            cx, cy, r = rng.uniform(0, width), rng.uniform(0, height), rng.uniform(0.05, 0.3) * min(width, height)
+            channel += rng.uniform(-80, 80) * np.exp(-((x - cx) ** 2 + (y - cy) ** 2) / (2 * r * r))
+        channels.append(channel)
+    image = np.stack(channels, axis=-1) + rng.normal(0, 6, (height, width, 3))
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def make_image(path, fmt, size, seed):
+    import numpy as np
+    from PIL import Image
+    width, height = size
+    img = Image.fromarray(synthetic_photo(width, height, seed))
+    if fmt == 'rgb-jpeg':
+        img.save(path, 'JPEG', quality=92)
+    elif fmt == 'l-jpeg':
+        img.convert('L').save(path, 'JPEG', quality=92)
+    elif fmt == 'cmyk-jpeg':
+        img.convert('CMYK').save(path, 'JPEG', quality=92)
+    elif fmt == 'rgba-png':
+        y, x = np.mgrid[0:height, 0:width]
+        distance = np.hypot((x - width / 2) / width, (y - height / 2) / height)
+        alpha = np.clip(255 * (1 - distance * 1.6), 0, 255).astype(np.uint8)
+        img.putalpha(Image.fromarray(alpha))
+        img.save(path, 'PNG')
+    else:
+        paletted = img.quantize(255)
+        pixels = np.array(paletted)
+        pixels[: height // 4, : width // 4] = 255  # Transparent corner
+        paletted = Image.fromarray(pixels, 'P')
+        paletted.putpalette(img.quantize(255).getpalette())
+        paletted.save(path, 'PNG' if fmt == 'p-png' else 'GIF', transparency=255)
+
+
+def make_video(path, size, codec, audio_codec, seconds):
+    import imageio_ffmpeg
+    width, height = size
+    command = [imageio_ffmpeg.get_ffmpeg_exe(), '-y', '-loglevel', 'error',
+               '-f', 'lavfi', '-i', f'testsrc2=size={width}x{height}:rate=25:duration={seconds}',
+               '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+               '-c:v', codec, '-pix_fmt', 'yuv420p', '-c:a', audio_codec]
+    if codec == 'libvpx-vp9':
+        command += ['-b:v', '2M', '-deadline', 'realtime', '-cpu-used', '8']
+    subprocess.run(command + [path], check=True)
+
+
+def build_corpus(workdir, args):
+    """[(case name, kind, source path)]"""
+    cases = []
+    for size_name, size in IMAGE_SIZES.items():
+        for seed, fmt in enumerate(IMAGE_FORMATS):
+            name = f'image-{fmt}-{size_name}'
+            extension = fmt.rsplit('-', 1)[1].replace('jpeg', 'jpg')
+            cases.append((name, 'image', os.path.join(workdir, f'{name}.{extension}'), (fmt, size, seed)))
+    for name, size, codec, container, audio_codec in VIDEO_CASES:
+        cases.append((f'video-{name}', 'video', os.path.join(workdir, f'video-{name}.{container}'),
+                      (size, codec, audio_codec)))
+
+    if args.quick:
+        cases = [case for case in cases if not any(skip in case[0] for skip in QUICK_SKIP)]
+    if args.cases:
+        cases = [case for case in cases if any(pattern in case[0] for pattern in args.cases)]
+
+    for name, kind, path, spec in cases:
+        if kind == 'image':
+            make_image(path, *spec)
+        else:
+            make_video(path, spec[0], spec[1], spec[2], args.video_seconds)
+    return [(name, kind, path) for name, kind, path, _ in cases]
+
+
+# ========== QUALITY ==========
+
+def psnr(reference, output):
+    import numpy as np
+    mse = np.mean((reference.astype(np.float64) - output.astype(np.float64)) ** 2)
+    return float('inf') if mse == 0 else float(10 * np.log10(255 ** 2 / mse))
+
+
+def ssim(reference, output, window=7):
+    """Mean SSIM on luma with a uniform window (Wang et al. 2004 constants)"""
+    import numpy as np
+    weights = np.array([0.299, 0.587, 0.114])
+    x = reference.astype(np.float64) @ weights
+    y = output.astype(np.float64) @ weights
+
+    def local_mean(a):
+        total = np.pad(a, ((1, 0), (1, 0))).cumsum(0).cumsum(1)
+        return (total[window:, window:] - total[:-window, window:] - total[window:, :-window]
+                + total[:-window, :-window]) / window ** 2
+
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    mx, my = local_mean(x), local_mean(y)
+    vx = local_mean(x * x) - mx * mx
+    vy = local_mean(y * y) - my * my
+    cov = local_mean(x * y) - mx * my
+    index = ((2 * mx * my + c1) * (2 * cov + c2)) / ((mx * mx + my * my + c1) * (vx + vy + c2))
+    return float(index.mean())
+
+
+def image_reference(source_path):
+    """What optimize_image should produce before JPEG encoding - letterboxed 1920x1080 RGB"""
+    import numpy as np
+    from PIL import Image
+    img = Image.open(source_path)
+    if img.mode == 'P' and 'transparency' in img.info:
+        img = img.convert('RGBA')
+    if img.mode == 'RGBA':
+        background = Image.new('RGB', img.size, (0, 0, 0))
+        background.paste(img, mask=img.split()[3])
+        img = background
+    img = img.convert('RGB')
+    img.thumbnail((1920, 1080), Image.Resampling.LANCZOS)
+    canvas = Image.new('RGB', (1920, 1080), (0, 0, 0))
+    canvas.paste(img, ((1920 - img.width) // 2, (1080 - img.height) // 2))
+    return np.asarray(canvas)
+
+
+def quality(kind, source_path, output_path, samples=5):
+    """(ssim, psnr) of the optimized output"""
+    import numpy as np
+    from PIL import Image
+    if kind == 'image':
+        reference = image_reference(source_path)
+        output = np.asarray(Image.open(output_path).convert('RGB'))
+        return ssim(reference, output), psnr(reference, output)
+
+    from moviepy.editor import VideoFileClip
+    scores = []
+    with VideoFileClip(source_path) as source, VideoFileClip(output_path) as output:
+        duration = min(source.duration, output.duration)
+        for index in range(samples):
+            t = duration * (index + 0.5) / samples
+            frame = output.get_frame(t)
+            reference = Image.fromarray(source.get_frame(t))
+            if reference.size != (frame.shape[1], frame.shape[0]):
+                reference = reference.resize((frame.shape[1], frame.shape[0]), Image.Resampling.LANCZOS)
+            reference = np.asarray(reference)
+            scores.append((ssim(reference, frame), psnr(reference, frame)))
+    return (sum(s[0] for s in scores) / len(scores), sum(s[1] for s in scores) / len(scores))
+
+
+# ========== RUNNER ==========
+
+def run_case_in_process(kind, source_path, output_path):
+    """Child process entry point: time one optimize call and print the measurements as JSON"""
+    import logging
+    logging.getLogger().setLevel(logging.ERROR)
+    from media_processing import optimize_image, optimize_video
+
+    def cpu_seconds():
+        own = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+    cpu_start, wall_start = cpu_seconds(), time.perf_counter()
+    if kind == 'image':
+        ok = optimize_image(source_path, output_path)
+    else:
+        # optimize_video falls back to copying the source - treat that as a failure
+        ok = optimize_video(source_path, output_path) != 30000
+    wall, cpu = time.perf_counter() - wall_start, cpu_seconds() - cpu_start
+
+    # VmHWM rather than RUSAGE_SELF: ru_maxrss carries the parent's peak over fork/exec
+    with open('/proc/self/status') as f:
+        own_kb = next(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))
+    peak_kb = max(own_kb, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    print(json.dumps({'ok': bool(ok), 'wall_s': wall, 'cpu_s': cpu, 'peak_rss_mb': peak_kb / 1024}))
+
+
+def run_case(name, kind, source_path, workdir, repeat):
+    output_path = os.path.join(workdir, f'{name}.out.' + ('jpg' if kind == 'image' else 'mp4'))
+    runs = []
+    for _ in range(repeat):
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        # cwd=workdir: moviepy writes its temporary audio track into the working directory
+        process = subprocess.run([sys.executable, os.path.abspath(__file__), '--run-case', kind, source_path, output_path],
+                                 cwd=workdir, capture_output=True, text=True)
+        lines = process.stdout.strip().splitlines()
+        if process.returncode or not lines:
+            return {'error': (process.stderr.strip().splitlines() or ['no output'])[-1]}
+        run = json.loads(lines[-1])
+        if not run['ok']:
+            return {'error': 'optimize call failed'}
+        runs.append(run)
+
+    result = {
+        # Best of N is the least noisy estimate of what the code itself costs
+        'wall_s': min(run['wall_s'] for run in runs),
+        'cpu_s': min(run['cpu_s'] for run in runs),
+        'peak_rss_mb': min(run['peak_rss_mb'] for run in runs),
+        'input_bytes': os.path.getsize(source_path),
+        'output_bytes': os.path.getsize(output_path),
+    }
+    result['ssim'], result['psnr_db'] = quality(kind, source_path, output_path)
+    return result
+
+
+def compare(results, baseline, args):
+    """Regressions of results against baseline - list of messages"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous or 'error' in previous:
+            continue
+        if 'error' in current:
+            regressions.append(f"{name}: {current['error']}")
+            continue
+        for metric, (higher_is_worse, kind) in METRICS.items():
+            old, new = previous.get(metric), current.get(metric)
+            if old is None or new is None:
+                continue
+            if kind == 'relative':
+                worse = new - old if higher_is_worse else old - new
+                # Sub-50ms timing differences are scheduler noise, not regressions
+                if metric in ('wall_s', 'cpu_s') and worse < args.min_delta:
+                    continue
+                if old and worse / old > args.threshold:
+                    regressions.append(f"{name}: {metric} {old:.4g} -> {new:.4g} (+{worse / old:.0%})")
+            else:
+                tolerance = args.ssim_tolerance if kind == 'ssim' else args.psnr_tolerance
+                if old - new > tolerance:
+                    regressions.append(f"{name}: {metric} {old:.4f} -> {new:.4f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--run-case', nargs=3, metavar=('KIND', 'SOURCE', 'OUTPUT'), help=argparse.SUPPRESS)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--video-seconds', type=float, default=3.0)
+    parser.add_argument('--quick', action='store_true', help='Skip the large images and 4K video')
+    parser.add_argument('--cases', nargs='+', help='Only run cases whose name contains one of these')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Compare against this results JSON and exit 1 on regressions')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed relative increase of time/RSS/size')
+    parser.add_argument('--min-delta', type=float, default=0.05, help='Ignore time increases below this many seconds')
+    parser.add_argument('--ssim-tolerance', type=float, default=0.005)
+    parser.add_argument('--psnr-tolerance', type=float, default=0.5)
+    args = parser.parse_args()
+
+    if args.run_case:
+        run_case_in_process(*args.run_case)
+        return
+
+    import PIL
+    import moviepy
+
+    workdir = tempfile.mkdtemp(prefix='magion-media-')
+    try:
+        cases = build_corpus(workdir, args)
+        print(f"{len(cases)} cases  repeat: {args.repeat}  Pillow {PIL.__version__}  moviepy {moviepy.__version__}")
+        print(f"{'case':28} {'wall':>8} {'cpu':>8} {'rss':>8} {'input':>9} {'output':>9} {'ssim':>7} {'psnr':>7}")
+        results = {}
+        for name, kind, source_path in cases:
+            result = results[name] = run_case(name, kind, source_path, workdir, args.repeat)
+            if 'error' in result:
+                print(f"{name:28} ERROR {result['error']}")
+                continue
+            print(f"{name:28} {result['wall_s']:7.2f}s {result['cpu_s']:7.2f}s {result['peak_rss_mb']:6.0f}MB "
+                  f"{result['input_bytes'] / 1024:7.0f}KB {result['output_bytes'] / 1024:7.0f}KB "
+                  f"{result['ssim']:7.4f} {result['psnr_db']:6.2f}dB")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'pillow': PIL.__version__,
+                'moviepy': moviepy.__version__,
+                'video_seconds': args.video_seconds,
+                'cases': results,
+            }, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline['cases'], args)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {args.baseline}:")
+            for message in regressions:
+                print(f"  {message}")
+            sys.exit(1)
+        print(f"\nNo regressions against {args.baseline} (threshold {args.threshold:.0%})")
+
+
+if __name__ == '__main__':
+    main()
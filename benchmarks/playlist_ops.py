@@ -0,0 +1,107 @@
+"""
+Playlist operation benchmark - reorder and assignment at scale
+
+Seeds a media library, then times /reorder, /screen/<id>/assign-media and
+/screen/<id>/reorder-media through the Flask test client while counting the SQL
+statements each request executes.
+
+    DATABASE_URL=sqlite:////tmp/bench.db python benchmarks/playlist_ops.py --sizes 200 1000 5000
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event  # noqa: E402
+
+import app_docker  # noqa: E402
+from app_docker import app, db, Media, Screen, ScreenMedia  # noqa: E402
+
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+def seed(size):
+    """Reset the benchmark screen and make sure the library holds at least `size` items"""
+    with app.app_context():
+        screen = Screen.query.filter_by(name='playlist-benchmark').first()
+        if not screen:
+            screen = Screen(name='playlist-benchmark', pairing_code=app_docker.generate_pairing_code())
+            db.session.add(screen)
+            db.session.flush()
+        ScreenMedia.query.filter_by(screen_id=screen.id).delete()
+
+        existing = Media.query.filter(Media.original_filename.like('playlist_%')).count()
+        if existing < size:
+            db.session.execute(db.insert(Media), [
+                {'filename': f'playlist_{i}.jpg', 'original_filename': f'playlist_{i}.jpg',
+                 'media_type': 'image', 'order_index': i}
+                for i in range(existing, size)
+            ])
+        db.session.commit()
+        ids = [row[0] for row in db.session.query(Media.id)
+               .filter(Media.original_filename.like('playlist_%')).order_by(Media.id).limit(size)]
+        return screen.id, ids
+
+
+def nudge(order, moves=10):
+    """Copy of order with a few items dragged elsewhere - the common drag-and-drop case"""
+    order = order[:]
+    for _ in range(moves):
+        order.insert(random.randrange(len(order)), order.pop(random.randrange(len(order))))
+    return order
+
+
+def timed(client, counter, method, url, payload):
+    counter.count = 0
+    start = time.perf_counter()
+    response = getattr(client, method)(url, json=payload)
+    elapsed = (time.perf_counter() - start) * 1000
+    assert response.status_code == 200, response.data
+    return elapsed, counter.count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[200, 1000, 5000])
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    counter = StatementCounter()
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', counter)
+
+    client = app.test_client()
+    client.post('/login', data={'username': os.environ.get('ADMIN_USERNAME', 'admin'),
+                                'password': os.environ.get('ADMIN_PASSWORD', 'magion2024')})
+
+    print(f"{'items':>6}  {'operation':<22} {'ms':>9} {'statements':>11}")
+    for size in args.sizes:
+        screen_id, ids = seed(size)
+        shuffled = ids[:]
+        random.shuffle(shuffled)
+
+        # Each "move 10" is relative to the order the previous operation left behind
+        operations = [
+            ('reorder (shuffle)', 'post', '/reorder', {'order': shuffled}),
+            ('reorder (move 10)', 'post', '/reorder', {'order': nudge(shuffled)}),
+            ('assign (all new)', 'post', f'/screen/{screen_id}/assign-media', {'media_ids': ids}),
+            ('assign (move 10)', 'post', f'/screen/{screen_id}/assign-media', {'media_ids': nudge(ids)}),
+            ('screen reorder', 'post', f'/screen/{screen_id}/reorder-media', {'media_ids': shuffled}),
+        ]
+        for label, method, url, payload in operations:
+            elapsed, statements = timed(client, counter, method, url, payload)
+            print(f"{size:>6}  {label:<22} {elapsed:9.1f} {statements:>11}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,341 @@
+"""
+Screen fleet load test - N simulated screens plus admin write traffic against a real server
+
+Seeds a fresh SQLite database (media library, playlists, media/iframe/json_api screens) in a
+temporary folder - database, media files and display cache never touch the real app folders -
+starts a stub upstream JSON feed and the app under gunicorn (as in the Dockerfile), then
+replays what the display templates do, with time compressed by --speedup:
+
+  media screens  (display.html)       page load, /static/sw.js, every playlist file once (the
+                                      service worker caches media), settings every 5 min,
+                                      redirect-check every 10 min, reload every 6 h
+  global screens (display.html)       as above on the legacy display URL plus
+                                      /api/media-list every minute
+  iframe screens (display_iframe.html) page load, settings every 5 min, redirect-check every 10 min
+  json screens   (display_json.html)  page load, settings every 5 min, json-data after 30 s and
+                                      then every 30-35 s with the last content hash
+
+Admin clients toggle media, change durations and reorder playlists at --admin-rate writes/s.
+Reports throughput and latency percentiles per endpoint, HTTP errors and SQLite lock errors
+("database is locked" in the server log):
+
+    python benchmarks/screen_fleet.py --screens 200 --duration 60 --speedup 30
+    python benchmarks/screen_fleet.py --screens 500 --mix 6:1:1:2 --admin-rate 5 --worker-class gevent
+
+Options: --screens 100 --mix 5:1:1:3 (media:global:iframe:json) --duration 60 --speedup 30
+         --media 40 --admin-rate 2 --workers 4 --worker-class sync --upstream-delay 0.2
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import brotli
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SETTINGS_INTERVAL = 300
+REDIRECT_CHECK_INTERVAL = 600
+MEDIA_LIST_INTERVAL = 60
+JSON_FIRST_FETCH = 30
+JSON_INTERVAL = 30
+JSON_JITTER = 5
+RELOAD_INTERVAL = 6 * 3600
+
+
+def start_upstream(delay):
+    """Stub booking feed"""
+    body = json.dumps({'infoskaerm': [
+        {'Titel': f'Booking {i}', 'FraTid': f'{8 + i % 14:02d}:00', 'TilTid': '23:59', 'Sted': f'Hal {i % 3 + 1}',
+         'Bruger': f'Forening {i}'} for i in range(40)
+    ]}).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def seed(args, feed_url):
+    """Media library, playlists and screens - returns [(kind, uuid, media paths)] and all media ids"""
+    import app_docker
+    from app_docker import app, db, Media, Screen, ScreenMedia
+
+    screens = []
+    with app.app_context():
+        media_rows = []
+        for index in range(args.media):
+            filename = f'fleet_{index}.jpg'
+            with open(os.path.join(app.config['OPTIMIZED_FOLDER'], filename), 'wb') as f:
+                f.write(os.urandom(args.media_kb * 1024))
+            media_rows.append(Media(filename=filename, original_filename=filename, media_type='image',
+                                    order_index=index, is_global=True))
+        db.session.add_all(media_rows)
+        db.session.flush()
+
+        weights = [int(part) for part in args.mix.split(':')]
+        kinds = random.Random(1).choices(['media', 'global', 'iframe', 'json'], weights=weights, k=args.screens)
+        for index, kind in enumerate(kinds):
+            screen = Screen(name=f'fleet-{index}', pairing_code=app_docker.generate_pairing_code())
+            if kind == 'iframe':
+                screen.display_mode, screen.iframe_url = 'iframe', 'https://example.com/'
+            elif kind == 'json':
+                # A handful of halls share each booking feed
+                screen.display_mode, screen.json_api_url = 'json_api', f'{feed_url}?hall={index % 10}'
+            db.session.add(screen)
+            db.session.flush()
+
+            paths = []
+            if kind == 'media':
+                playlist = random.Random(index).sample(media_rows, min(8, len(media_rows)))
+                for order, media in enumerate(playlist):
+                    db.session.add(ScreenMedia(screen_id=screen.id, media_id=media.id, order_index=order))
+                paths = [f'/media/{media.filename}' for media in playlist]
+            elif kind == 'global':
+                paths = [f'/media/{media.filename}' for media in media_rows]
+            screens.append((kind, screen.uuid, paths))
+        db.session.commit()
+        return screens, [media.id for media in media_rows]
+
+
+class Stats:
+    def __init__(self):
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def add(self, label, elapsed, status):
+        with self.lock:
+            self.samples.setdefault(label, []).append((elapsed, status))
+
+
+def decode_body(head, body):
+    """Undo the Content-Encoding the server picked (gzip or br)"""
+    for line in head.split(b'\r\n')[1:]:
+        name, _, value = line.partition(b':')
+        if name.strip().lower() == b'content-encoding':
+            encoding = value.strip().lower()
+            if encoding == b'gzip':
+                return gzip.decompress(body)
+            if encoding == b'br':
+                return brotli.decompress(body)
+    return body
+
+
+async def http_get(port, path, stats, label):
+    """Plain HTTP/1.1 GET like a browser tab - returns (status, decoded body)"""
+    start = time.perf_counter()
+    status, body = 0, b''
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout=30)
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\nAccept-Encoding: gzip, br\r\n'
+                     f'Connection: close\r\n\r\n'.encode())
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout=60)
+        writer.close()
+        head, _, body = response.partition(b'\r\n\r\n')
+        status = int(head.split(b' ', 2)[1])
+        body = decode_body(head, body)
+    except (OSError, asyncio.TimeoutError, ValueError, IndexError, EOFError, zlib.error, brotli.error):
+        pass
+    stats.add(label, time.perf_counter() - start, status)
+    return status, body
+
+
+async def screen_client(port, kind, uuid, media_paths, speedup, stop_at, stats, ramp):
+    """Follow the polling schedule of the template this screen renders"""
+    await asyncio.sleep(random.uniform(0, ramp))
+    page = '/secure-display-x9k2m8p4q7' if kind == 'global' else f'/screen/{uuid}'
+    redirect_check = '/api/redirect-check' if kind == 'global' else f'/api/redirect-check?screen={uuid}'
+    data_hash = ''
+
+    async def load_page():
+        await http_get(port, page, stats, 'page')
+        if kind in ('media', 'global'):
+            await http_get(port, '/static/sw.js', stats, 'static')
+            for path in media_paths:  # First loop only - the service worker serves them afterwards
+                await http_get(port, path, stats, 'media')
+
+    await load_page()
+    now = time.time()
+    schedule = {
+        'settings': now + SETTINGS_INTERVAL / speedup,
+        'reload': now + RELOAD_INTERVAL / speedup,
+    }
+    if kind != 'json':
+        schedule['redirect-check'] = now + REDIRECT_CHECK_INTERVAL / speedup
+    if kind == 'global':
+        schedule['media-list'] = now + MEDIA_LIST_INTERVAL / speedup
+    if kind == 'json':
+        schedule['json-data'] = now + JSON_FIRST_FETCH / speedup
+
+    while True:
+        event, due = min(schedule.items(), key=lambda item: item[1])
+        if due >= stop_at:
+            return
+        await asyncio.sleep(max(0, due - time.time()))
+
+        if event == 'settings':
+            await http_get(port, f'/api/screen/{uuid}/settings', stats, 'settings')
+            schedule[event] = due + SETTINGS_INTERVAL / speedup
+        elif event == 'redirect-check':
+            await http_get(port, redirect_check, stats, 'redirect-check')
+            schedule[event] = due + REDIRECT_CHECK_INTERVAL / speedup
+        elif event == 'media-list':
+            await http_get(port, '/api/media-list', stats, 'media-list')
+            schedule[event] = due + MEDIA_LIST_INTERVAL / speedup
+        elif event == 'json-data':
+            status, body = await http_get(port, f'/api/screen/{uuid}/json-data?hash={data_hash}', stats, 'json-data')
+            if status == 200:
+                try:
+                    data_hash = json.loads(body).get('hash', data_hash)
+                except ValueError:
+                    pass
+            schedule[event] = due + (JSON_INTERVAL + random.uniform(0, JSON_JITTER)) / speedup
+        elif event == 'reload':
+            await load_page()
+            schedule[event] = due + RELOAD_INTERVAL / speedup
+
+
+def admin_client(port, media_ids, rate, stop_at, stats):
+    """Dashboard user: toggles, duration edits and playlist reorders"""
+    import requests
+    session = requests.Session()
+    session.post(f'http://127.0.0.1:{port}/login', data={
+        'username': os.environ.get('ADMIN_USERNAME', 'admin'),
+        'password': os.environ.get('ADMIN_PASSWORD', 'magion2024')})
+    base = f'http://127.0.0.1:{port}'
+    i = 0
+    while time.time() < stop_at:
+        media_id = random.choice(media_ids)
+        start = time.perf_counter()
+        try:
+            if i % 3 == 0:
+                response = session.get(f'{base}/toggle/{media_id}', allow_redirects=False)
+                label = 'admin-toggle'
+            elif i % 3 == 1:
+                response = session.post(f'{base}/update_duration/{media_id}', json={'duration': 4000 + i % 5000})
+                label = 'admin-duration'
+            else:
+                order = random.sample(media_ids, len(media_ids))
+                response = session.post(f'{base}/reorder', json={'order': order})
+                label = 'admin-reorder'
+            status = response.status_code
+        except requests.RequestException:
+            label, status = 'admin-error', 0
+        stats.add(label, time.perf_counter() - start, status)
+        i += 1
+        time.sleep(1 / rate)
+
+
+def report(stats, duration, log_path):
+    print(f"{'endpoint':16} {'requests':>9} {'req/s':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'errors':>7} {'503':>6}")
+    for label in sorted(stats.samples):
+        samples = stats.samples[label]
+        latencies = sorted(s[0] * 1000 for s in samples)
+        errors = sum(1 for s in samples if s[1] == 0 or (s[1] >= 400 and s[1] != 503))
+        deferred = sum(1 for s in samples if s[1] == 503)  # Shed by admission control, retried by the screen
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f"{label:16} {len(samples):9} {len(samples) / duration:8.1f} {statistics.median(latencies):7.1f}ms "
+              f"{p95:7.1f}ms {p99:7.1f}ms {errors:7} {deferred:6}")
+    with open(log_path, errors='replace') as f:
+        log = f.read()
+    print(f"SQLite lock errors in server log: {log.count('database is locked')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--screens', type=int, default=100)
+    parser.add_argument('--mix', default='5:1:1:3', help='media:global:iframe:json screen weights')
+    parser.add_argument('--duration', type=float, default=60.0)
+    parser.add_argument('--speedup', type=float, default=30.0, help='Compress the polling intervals by this factor')
+    parser.add_argument('--media', type=int, default=40)
+    parser.add_argument('--media-kb', type=int, default=64)
+    parser.add_argument('--admin-rate', type=float, default=2.0, help='Admin writes per second')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--worker-class', default='sync')
+    parser.add_argument('--upstream-delay', type=float, default=0.2)
+    parser.add_argument('--port', type=int, default=45791)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='magion-fleet-')
+    # Always the temp folder, also inside the container where compose points these at production data
+    os.environ.update({
+        'DATABASE_URL': f'sqlite:///{workdir}/fleet.db',
+        'DISPLAY_CACHE_FOLDER': os.path.join(workdir, 'display_cache'),
+        'OPTIMIZED_FOLDER': os.path.join(workdir, 'optimized'),
+        'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+        'BROADCAST_STAMP': os.path.join(workdir, 'broadcast.stamp'),
+    })
+
+    upstream = start_upstream(args.upstream_delay)
+    screens, media_ids = seed(args, f'http://127.0.0.1:{upstream.server_port}/feed.json')
+
+    log_path = os.path.join(workdir, 'server.log')
+    with open(log_path, 'w') as log:
+        server = subprocess.Popen(['gunicorn', '--bind', f'127.0.0.1:{args.port}', '--workers', str(args.workers),
+                                   '--worker-class', args.worker_class, '--timeout', '120', '--backlog', '4096',
+                                   'app_docker:app'], cwd=ROOT, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        import requests
+        deadline = time.time() + 30
+        while True:
+            try:
+                requests.get(f'http://127.0.0.1:{args.port}/health', timeout=1)
+                break
+            except requests.RequestException:
+                if time.time() > deadline:
+                    raise RuntimeError('Server did not start - see ' + log_path)
+                time.sleep(0.2)
+
+        kinds = {kind: sum(1 for s in screens if s[0] == kind) for kind in ('media', 'global', 'iframe', 'json')}
+        print(f"screens: {args.screens} {kinds}  admin: {args.admin_rate}/s  duration: {args.duration}s  "
+              f"speedup: {args.speedup}x  workers: {args.workers} ({args.worker_class})")
+
+        stats = Stats()
+        stop_at = time.time() + args.duration
+        admin = threading.Thread(target=admin_client, args=(args.port, media_ids, args.admin_rate, stop_at, stats),
+                             daemon=True)
+        admin.start()
+        ramp = min(args.duration / 4, 10)
+
+        async def fleet():
+            await asyncio.gather(*(screen_client(args.port, kind, uuid, paths, args.speedup, stop_at, stats, ramp)
+                                   for kind, uuid, paths in screens))
+
+        asyncio.run(fleet())
+        admin.join()
+        report(stats, args.duration, log_path)
+    finally:
+        server.terminate()
+        server.wait()
+        upstream.shutdown()
+    shutil.rmtree(workdir, ignore_errors=True)  # Only after a clean run - on failure the server log is kept
+
+
+if __name__ == '__main__':
+    main()
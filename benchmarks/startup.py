@@ -0,0 +1,59 @@
+"""
+Worker startup benchmark - import time and RSS of the app module
+
+Each measurement runs in a fresh interpreter, like a new gunicorn worker. The
+"eager" variant imports the media libraries up front (the old top-level imports),
+the "lazy" variant imports only app_docker, and "player" builds the read-only
+player service (player:create_app()).
+
+    python benchmarks/startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, resource, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+{preload}
+elapsed = time.perf_counter() - start
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{'seconds': elapsed, 'rss_mb': rss_kb / 1024, 'modules': len(sys.modules)}}))
+"""
+
+VARIANTS = {
+    'eager': 'from PIL import Image\nfrom moviepy.editor import VideoFileClip\nimport qrcode\nimport app_docker',
+    'lazy': 'import app_docker',
+    'player': 'import player\nplayer.create_app()',
+}
+
+
+def measure(preload):
+    code = PROBE.format(root=ROOT, preload=preload)
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', 'sqlite:////tmp/magion-startup-bench.db')
+    output = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    for name, preload in VARIANTS.items():
+        measure(preload)  # Warm the bytecode and filesystem caches
+        samples = [measure(preload) for _ in range(args.runs)]
+        print(f"{name:6} import {statistics.median(s['seconds'] for s in samples) * 1000:8.1f}ms  "
+              f"RSS {statistics.median(s['rss_mb'] for s in samples):7.1f}MB  "
+              f"modules {samples[0]['modules']}")
+
+
+if __name__ == '__main__':
+    main()
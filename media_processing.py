@@ -0,0 +1,201 @@
+"""
+Media processing for uploads (image/video optimisation)
+
+Kept out of app_docker.py on purpose: PIL and moviepy.editor (numpy, imageio,
+imageio-ffmpeg, decorator, tqdm) are heavy to import. Only the upload routes
+import this module, so display-only gunicorn workers never load them.
+"""
+import os
+import shutil
+import logging
+import subprocess
+from PIL import Image
+from moviepy.editor import VideoFileClip
+from imageio_ffmpeg import get_ffmpeg_exe
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = (320, 180)
+VIDEO_PACKAGING = os.environ.get('VIDEO_PACKAGING', 'mp4')  # 'mp4', or 'hls' = also fMP4 HLS segments next to the MP4
+HLS_SEGMENT_SECONDS = int(os.environ.get('HLS_SEGMENT_SECONDS', 4))
+FFMPEG_TIMEOUT = 600  # Seconds for a remux/packaging run (stream copy, no re-encode)
+
+def optimize_image(input_path, output_path):
+    """Optimize image to EXACTLY 1920x1080 with black background"""
+    try:
+        img = Image.open(input_path)
+
+        # Convert to RGB if needed
+        if img.mode in ('RGBA', 'LA', 'P'):
+            background = Image.new('RGB', img.size, (0, 0, 0))
+            if img.mode == 'RGBA':
+                background.paste(img, mask=img.split()[3])
+            else:
+                background.paste(img)
+            img = background
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        # RESIZE TO FIT 1920x1080 WITH BLACK BACKGROUND
+        # This ensures ALL images are EXACTLY 1920x1080
+
+        # Calculate new size maintaining aspect ratio
+        img.thumbnail((1920, 1080), Image.Resampling.LANCZOS)
+
+        # Create black canvas at EXACT 1920x1080
+        final_img = Image.new('RGB', (1920, 1080), (0, 0, 0))
+
+        # Center the image on the canvas
+        x_offset = (1920 - img.width) // 2
+        y_offset = (1080 - img.height) // 2
+        final_img.paste(img, (x_offset, y_offset))
+
+        # Save optimized image
+        final_img.save(output_path, 'JPEG', quality=85, optimize=True)
+
+        logger.info(f"Image optimized: {os.path.basename(input_path)} -> 1920x1080")
+        return True
+    except Exception as e:
+        logger.error(f"Error optimizing image: {e}")
+        return False
+
+def optimize_video(input_path, output_path):
+    """Optimize video for display"""
+    # moov atom first, so playback starts before the whole file is downloaded
+    ffmpeg_params = ['-movflags', '+faststart']
+    if VIDEO_PACKAGING == 'hls':
+        # A keyframe at every segment boundary, so the stream-copied HLS segments get the intended length
+        ffmpeg_params += ['-force_key_frames', f'expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})']
+    try:
+        video = VideoFileClip(input_path)
+        
+        if video.w > 1920 or video.h > 1080:
+            if video.w / video.h > 1920 / 1080:
+                video = video.resize(width=1920)
+            else:
+                video = video.resize(height=1080)
+        
+        video.write_videofile(output_path, codec='libx264', audio_codec='aac', bitrate='5000k',
+                              ffmpeg_params=ffmpeg_params)
+        duration = int(video.duration * 1000)
+        video.close()
+        return duration
+    except Exception as e:
+        logger.error(f"Error optimizing video: {e}")
+        if not remux_faststart(input_path, output_path):
+            shutil.copy2(input_path, output_path)
+        return 30000
+
+def run_ffmpeg(args):
+    """Run the ffmpeg bundled with imageio-ffmpeg - True on success"""
+    try:
+        subprocess.run([get_ffmpeg_exe(), '-y', '-v', 'error'] + args,
+                       check=True, capture_output=True, timeout=FFMPEG_TIMEOUT)
+        return True
+    except subprocess.CalledProcessError as e:
+        logger.error(f"ffmpeg failed: {e.stderr.decode(errors='replace').strip()[-500:]}")
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.error(f"ffmpeg failed: {e}")
+    return False
+
+def remux_faststart(input_path, output_path):
+    """Copy the streams into an MP4 with the moov atom first - no re-encode"""
+    temp_path = output_path + '.part.mp4'
+    if run_ffmpeg(['-i', input_path, '-map', '0', '-c', 'copy', '-movflags', '+faststart', temp_path]):
+        os.replace(temp_path, output_path)
+        return True
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    return False
+
+def stream_playlist(optimized_filename):
+    """HLS playlist for an optimized video, relative to the optimized folder"""
+    return optimized_filename.rsplit('.', 1)[0] + '.hls/index.m3u8'
+
+def package_hls(video_path, playlist_path):
+    """Split an optimized MP4 into fMP4 HLS segments next to it (stream copy) - True on success"""
+    folder = os.path.dirname(playlist_path)
+    os.makedirs(folder, exist_ok=True)
+    packaged = run_ffmpeg([
+        '-i', video_path, '-map', '0', '-c', 'copy',
+        '-f', 'hls', '-hls_time', str(HLS_SEGMENT_SECONDS), '-hls_playlist_type', 'vod',
+        '-hls_segment_type', 'fmp4', '-hls_fmp4_init_filename', 'init.mp4',
+        '-hls_segment_filename', os.path.join(folder, 'seg_%04d.m4s'),
+        playlist_path,
+    ])
+    if not packaged:
+        shutil.rmtree(folder, ignore_errors=True)
+    return packaged
+
+def thumbnail_filename(optimized_filename):
+    """Thumbnail name for an optimized media file"""
+    return optimized_filename.rsplit('.', 1)[0] + '.webp'
+
+def create_thumbnail(source_path, thumbnail_path, media_type):
+    """Create a small WebP preview - scaled image or video poster frame"""
+    try:
+        if media_type == 'video':
+            with VideoFileClip(source_path) as clip:
+                # Grab a frame a little into the clip to skip black fade-ins
+                frame = clip.get_frame(min(1.0, clip.duration / 2))
+            img = Image.fromarray(frame)
+        else:
+            img = Image.open(source_path)
+            img.draft('RGB', (THUMBNAIL_SIZE[0] * 2, THUMBNAIL_SIZE[1] * 2))  # Fast JPEG downscale on decode
+            img = img.convert('RGB')
+
+        img.thumbnail(THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
+        img.save(thumbnail_path, 'WEBP', quality=70, method=4)
+        return True
+    except Exception as e:
+        logger.error(f"Error creating thumbnail for {os.path.basename(source_path)}: {e}")
+        return False
+
+def has_alpha(img):
+    """True if the image carries transparency that must survive conversion"""
+    return img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info)
+
+def normalize_logo(input_path, output_path, max_size):
+    """Resize a logo to fit max_size (never upscaled) and save as optimized PNG, keeping transparency"""
+    try:
+        img = Image.open(input_path)
+        img = img.convert('RGBA') if has_alpha(img) else img.convert('RGB')
+        img.thumbnail(max_size, Image.Resampling.LANCZOS)
+        img.save(output_path, 'PNG', optimize=True)
+        return True
+    except Exception as e:
+        logger.error(f"Error normalizing logo {os.path.basename(input_path)}: {e}")
+        return False
+
+def build_sprite_sheet(input_paths, output_path, max_size):
+    """Pack logos side by side into one transparent PNG - returns the coordinate map or None
+
+    Each logo is scaled to fit max_size and vertically centred in a strip max_size[1] high.
+    Map: {'width', 'height', 'items': [{'x', 'width'}]} in sprite pixels, in input order.
+    If any logo can't be read (e.g. SVG) no sheet is built, so the ticker falls back to
+    individual images and never drops a sponsor.
+    """
+    logos = []
+    for path in input_paths:
+        try:
+            img = Image.open(path).convert('RGBA')
+            img.thumbnail(max_size, Image.Resampling.LANCZOS)
+            logos.append(img)
+        except Exception as e:
+            logger.warning(f"No sprite sheet - {os.path.basename(path)} is not a raster image: {e}")
+            return None
+
+    if not logos:
+        return None
+
+    height = max_size[1]
+    sheet = Image.new('RGBA', (sum(img.width for img in logos), height), (0, 0, 0, 0))
+    items = []
+    x = 0
+    for img in logos:
+        sheet.paste(img, (x, (height - img.height) // 2))
+        items.append({'x': x, 'width': img.width})
+        x += img.width
+
+    sheet.save(output_path, 'PNG', optimize=True)
+    return {'width': sheet.width, 'height': height, 'items': items}
@@ -0,0 +1,269 @@
+"""
+Database models and engine profile shared by the admin app (app.py) and the player service (player.py)
+"""
+import hashlib
+import os
+import sqlite3
+import uuid
+from datetime import datetime
+from flask_login import UserMixin
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Database engine profile
+# SQLite (default) gets tuned per-connection pragmas, PostgreSQL is used when DATABASE_URL points to it
+DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:////app/data/infoskaerm.db')
+if DATABASE_URL.startswith('postgres://'):
+    # SQLAlchemy only accepts the postgresql:// scheme
+    DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
+
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),  # ms to wait for a lock
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),  # Safe with WAL, far fewer fsyncs
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -20000)),  # Negative = KiB, i.e. 20MB
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 268435456)),  # 256MB memory-mapped I/O
+    'temp_store': os.environ.get('SQLITE_TEMP_STORE', 'MEMORY'),
+}
+
+def build_engine_options(database_url):
+    """Build SQLAlchemy engine options (pool sizing) for the configured database"""
+    pool_options = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+    }
+
+    if database_url.startswith('sqlite'):
+        if ':memory:' in database_url or database_url.rstrip('/') == 'sqlite:':
+            # In-memory databases use a single shared connection - no pool to size
+            return {}
+        pool_options['connect_args'] = {
+            'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000,
+            'check_same_thread': False
+        }
+        return pool_options
+
+    # PostgreSQL and other server databases: detect dropped connections and recycle old ones
+    pool_options['pool_pre_ping'] = True
+    pool_options['pool_recycle'] = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    return pool_options
+
+@event.listens_for(Engine, 'connect')
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Apply the SQLite tuning profile to every new connection in the pool"""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for pragma, value in SQLITE_PRAGMAS.items():
+        try:
+            cursor.execute(f"PRAGMA {pragma}={value}")
+        except sqlite3.OperationalError:
+            # Read-only connections (player service) can't switch journal mode - the admin app already did
+            if pragma != 'journal_mode':
+                raise
+    cursor.close()
+
+db = SQLAlchemy()
+
+# Database models
+class User(UserMixin, db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(100), unique=True, nullable=False)
+    password_hash = db.Column(db.String(200))
+    is_admin = db.Column(db.Boolean, default=False)
+    role = db.Column(db.String(20), default='user')  # 'admin' or 'user'
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_login = db.Column(db.DateTime)
+
+    def password_version(self):
+        """Short fingerprint of the password hash - changes whenever the password does"""
+        return hashlib.sha256((self.password_hash or '').encode()).hexdigest()[:12]
+
+    def get_id(self):
+        """Session id '<id>:<password version>' - a password change ends the user's other sessions"""
+        return f'{self.id}:{self.password_version()}'
+
+class LoginLog(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    username = db.Column(db.String(100))
+    login_time = db.Column(db.DateTime, default=datetime.utcnow)
+    ip_address = db.Column(db.String(50))
+    user_agent = db.Column(db.String(500))
+
+class Media(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(200), nullable=False)
+    original_filename = db.Column(db.String(200), nullable=False)
+    media_type = db.Column(db.String(20))
+    duration = db.Column(db.Integer, default=5000)
+    active = db.Column(db.Boolean, default=True)
+    order_index = db.Column(db.Integer, default=0, index=True)
+    uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    uploaded_by = db.Column(db.Integer, db.ForeignKey('user.id'))
+    is_global = db.Column(db.Boolean, default=True)  # Global media shown on all screens
+    thumbnail = db.Column(db.String(200), nullable=True)  # WebP preview/poster frame in THUMBNAIL_FOLDER
+
+    # Expire/scheduling settings
+    expire_at = db.Column(db.DateTime, nullable=True)  # When to stop showing this media
+    auto_delete = db.Column(db.Boolean, default=False)  # Delete file after expire_at
+
+    file_size = db.Column(db.BigInteger, nullable=True)  # Bytes of the optimized file, recorded at write time
+    source_filename = db.Column(db.String(200), nullable=True)  # Original upload in UPLOAD_FOLDER
+    stream_playlist = db.Column(db.String(200), nullable=True)  # HLS playlist in OPTIMIZED_FOLDER (VIDEO_PACKAGING=hls)
+
+class Settings(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(100), unique=True, nullable=False)
+    value = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class StorageUsage(db.Model):
+    """Disk usage counters per storage area, maintained incrementally on every file write/delete"""
+    __tablename__ = 'storage_usage'
+    area = db.Column(db.String(20), primary_key=True)  # 'optimized' or 'uploads'
+    size = db.Column(db.BigInteger, default=0, nullable=False)
+    count = db.Column(db.Integer, default=0, nullable=False)
+    reconciled_at = db.Column(db.DateTime)  # Last full scan of the folder
+
+# Association table for Screen <-> Media (many-to-many)
+# We need a proper association object to store screen-specific settings like duration
+class ScreenMedia(db.Model):
+    __tablename__ = 'screen_media'
+    __table_args__ = (db.Index('ix_screen_media_screen_order', 'screen_id', 'order_index'),)
+    screen_id = db.Column(db.Integer, db.ForeignKey('screen.id'), primary_key=True)
+    media_id = db.Column(db.Integer, db.ForeignKey('media.id'), primary_key=True)
+    order_index = db.Column(db.Integer, default=0)
+    duration = db.Column(db.Integer, nullable=True)  # Screen-specific duration override
+
+class SponsorCarousel(db.Model):
+    """Sponsor logos for carousel ticker"""
+    __tablename__ = 'sponsor_carousel'
+    __table_args__ = (db.Index('ix_sponsor_carousel_screen_order', 'screen_id', 'order_index'),)
+    id = db.Column(db.Integer, primary_key=True)
+    screen_id = db.Column(db.Integer, db.ForeignKey('screen.id'), nullable=False)
+    filename = db.Column(db.String(500), nullable=False)
+    original_filename = db.Column(db.String(200), nullable=False)
+    order_index = db.Column(db.Integer, default=0)
+    uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    uploaded_by = db.Column(db.Integer, db.ForeignKey('user.id'))
+    file_size = db.Column(db.BigInteger, nullable=True)
+
+class Screen(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    uuid = db.Column(db.String(36), unique=True, nullable=False, default=lambda: str(uuid.uuid4()))
+    name = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.Text)
+    location = db.Column(db.String(200))
+    active = db.Column(db.Boolean, default=True)
+    pairing_code = db.Column(db.String(6), unique=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'))
+
+    # Redirect settings (per screen)
+    redirect_enabled = db.Column(db.Boolean, default=False)
+    redirect_url = db.Column(db.Text)
+
+    # Display mode settings (per screen)
+    display_mode = db.Column(db.String(20), default='media')  # 'media', 'redirect', 'iframe', 'json_api'
+    iframe_url = db.Column(db.Text)
+    iframe_margin_left = db.Column(db.Integer, default=0)  # Left margin in pixels
+    iframe_margin_right = db.Column(db.Integer, default=0)  # Right margin in pixels
+    json_api_url = db.Column(db.Text)
+    json_template = db.Column(db.String(50), default='schedule')  # 'schedule', 'custom'
+    json_dedupe_key = db.Column(db.String(100))  # Comma separated fields identifying duplicates across feeds
+    sponsor_logo_path = db.Column(db.String(500))  # Path to sponsor logo image
+    magion_logo_path = db.Column(db.String(500))  # Path to MAGION logo image
+
+    # Sponsor carousel settings
+    carousel_enabled = db.Column(db.Boolean, default=False)  # Enable/disable sponsor carousel
+    carousel_speed = db.Column(db.String(20), default='medium')  # 'slow', 'medium', 'fast'
+    carousel_sprite_path = db.Column(db.String(500))  # All carousel logos packed in one image
+    carousel_sprite_map = db.Column(db.Text)  # JSON coordinate map for the sprite sheet
+
+    # IP tracking and admin fields
+    last_access_ip = db.Column(db.String(50))  # WAN/Public IP (from X-Forwarded-For)
+    last_access_lan_ip = db.Column(db.String(50))  # LAN/Local IP (from remote_addr)
+    last_access_time = db.Column(db.DateTime)  # When was the screen last accessed
+    admin_notes = db.Column(db.Text)  # Internal notes/comments about this screen
+    custom_url = db.Column(db.Text)  # Custom URL field for reference
+
+    # Relationship to media through association object
+    media_associations = db.relationship('ScreenMedia', backref='screen', cascade='all, delete-orphan', order_by='ScreenMedia.order_index')
+
+    # Relationship to sponsor carousel logos
+    carousel_sponsors = db.relationship('SponsorCarousel', backref='screen', cascade='all, delete-orphan', order_by='SponsorCarousel.order_index')
+
+    @property
+    def media_items(self):
+        """Get media items for backwards compatibility"""
+        return [assoc.media for assoc in self.media_associations if assoc.media]
+
+class Broadcast(db.Model):
+    """Override pushed to the displays as an overlay until it expires or is cancelled"""
+    id = db.Column(db.Integer, primary_key=True)
+    message = db.Column(db.Text)
+    image_path = db.Column(db.String(500))  # /uploads/broadcasts/...
+    url = db.Column(db.Text)  # Page shown full screen instead of message/image
+    target_screens = db.Column(db.Text)  # Comma separated screen uuids - empty means every screen
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    cancelled = db.Column(db.Boolean, default=False)
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'))
+
+    def target_uuids(self):
+        """Targeted screen uuids - None for every screen"""
+        uuids = {uuid.strip() for uuid in (self.target_screens or '').split(',') if uuid.strip()}
+        return uuids or None
+
+# Add relationship to Media model too
+Media.screen_associations = db.relationship('ScreenMedia', backref='media', cascade='all, delete-orphan')
+
+def configure_database(app, read_only=False):
+    """Bind db to an app - read_only opens SQLite with mode=ro and PostgreSQL in read-only transactions"""
+    database_url = DATABASE_URL
+    engine_options = build_engine_options(DATABASE_URL)
+    if read_only and database_url.startswith('sqlite:///') and ':memory:' not in database_url:
+        database_url = f"sqlite:///file:{database_url[len('sqlite:///'):]}?mode=ro&uri=true"
+    elif read_only and database_url.startswith('postgresql'):
+        engine_options.setdefault('connect_args', {})['options'] = '-c default_transaction_read_only=on'
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
+    app.config['DATABASE_READ_ONLY'] = read_only
+    if database_url.startswith('postgresql'):
+        make_psycopg2_cooperative()
+    db.init_app(app)
+
+def make_psycopg2_cooperative():
+    """On gevent workers, let psycopg2 wait on the gevent hub instead of blocking the whole worker
+
+    The same wait callback psycogreen installs - without it one slow query stalls every stream and
+    display connection the worker holds.
+    """
+    try:
+        from gevent import monkey
+        if not monkey.is_module_patched('socket'):
+            return False
+        from gevent.socket import wait_read, wait_write
+        import psycopg2
+        from psycopg2 import extensions
+    except ImportError:
+        return False
+
+    def gevent_wait_callback(conn, timeout=None):
+        while True:
+            state = conn.poll()
+            if state == extensions.POLL_OK:
+                break
+            elif state == extensions.POLL_READ:
+                wait_read(conn.fileno(), timeout=timeout)
+            elif state == extensions.POLL_WRITE:
+                wait_write(conn.fileno(), timeout=timeout)
+            else:
+                raise psycopg2.OperationalError(f"Bad result from poll: {state}")
+
+    extensions.set_wait_callback(gevent_wait_callback)
+    return True
@@ -0,0 +1,929 @@
+"""
+Player service - the read-only, unauthenticated endpoints screens poll
+
+The admin app registers these routes through init_player(). They can also run as a separate
+lightweight service that opens the database read-only and is scaled on its own:
+
+    gunicorn --workers 8 'player:create_app()'
+"""
+import hashlib
+import importlib.util
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+from flask import Flask, current_app, render_template, request, redirect, jsonify, send_from_directory
+from flask_uuid import FlaskUUID
+import requests
+from models import db, Media, Screen, Settings
+from app_logging import configure_logging, log_event
+
+logger = logging.getLogger(__name__)
+
+# ========== JSON FEEDS ==========
+
+JSON_FEED_TTL = int(os.environ.get('JSON_FEED_TTL', 30))  # Seconds an upstream response is shared before refetching
+JSON_FEED_TIMEOUT = int(os.environ.get('JSON_FEED_TIMEOUT', 10))  # Per feed - a slow feed is skipped, not waited for
+JSON_FEED_WAIT_MARGIN = 1  # Seconds the pool waits beyond JSON_FEED_TIMEOUT, so the request's own timeout fires first
+JSON_FEED_WORKERS = int(os.environ.get('JSON_FEED_WORKERS', 8))
+COMPACT_JSON_TEMPLATES = {'compact', 'compact-large'}  # Templates that never show the user field
+DEFAULT_DEDUPE_KEY = 'titel,fratid,sted'
+json_feed_cache = {}  # url -> {'fetched_at', 'activities'}
+json_feed_projections = {}  # (urls, template, dedupe_key) -> (feed versions, activities, hash)
+json_feed_failures = {}  # url -> (failed_at, exception type, message, response) - failing feeds are not retried on every request
+json_feed_locks = {}
+json_feed_locks_guard = threading.Lock()
+json_feed_session = requests.Session()  # Keep-alive connections shared by all feeds
+json_feed_session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=JSON_FEED_WORKERS))
+json_feed_session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=JSON_FEED_WORKERS))
+json_feed_executor = ThreadPoolExecutor(max_workers=JSON_FEED_WORKERS, thread_name_prefix='json-feed')
+
+def screen_feed_urls(screen):
+    """Feed URLs configured for a screen - one per line in json_api_url"""
+    return [url.strip() for url in (screen.json_api_url or '').split() if url.strip()]
+
+def extract_activities(data):
+    """Find the activity list in an upstream response - same formats as parseJsonData in display_json.html"""
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        if data.get('infoskaerm'):
+            return data['infoskaerm']
+        for value in data.values():
+            if isinstance(value, list):
+                return value
+    return []
+
+def time_to_minutes(value):
+    """Parse 'HH:MM' to minutes after midnight - None if it can't be parsed"""
+    try:
+        hours, minutes = str(value).split(':')[:2]
+        return int(hours) * 60 + int(minutes)
+    except (TypeError, ValueError):
+        return None
+
+def project_activities(activities, json_template, dedupe_key=DEFAULT_DEDUPE_KEY):
+    """Reduce upstream activities to today's remaining ones with only the fields the template renders"""
+    # Server clock may lag the screens (UTC container) - that only keeps activities longer, the client filters too
+    now = datetime.now()
+    current_minutes = now.hour * 60 + now.minute
+    include_user = json_template not in COMPACT_JSON_TEMPLATES
+    dedupe_fields = [field.strip() for field in (dedupe_key or DEFAULT_DEDUPE_KEY).split(',') if field.strip()]
+
+    projected_activities = []
+    seen = set()
+    for activity in activities:
+        if not isinstance(activity, dict):
+            continue
+        end_minutes = time_to_minutes(activity.get('tiltid') or activity.get('TilTid'))
+        if end_minutes is not None and end_minutes <= current_minutes:
+            continue
+        projected = {
+            'titel': activity.get('titel') or activity.get('Titel') or '',
+            'fratid': activity.get('fratid') or activity.get('FraTid') or '',
+            'tiltid': activity.get('tiltid') or activity.get('TilTid') or '',
+            'sted': activity.get('sted') or activity.get('Sted') or '',
+            'brugernavn': activity.get('brugernavn') or activity.get('Bruger') or '',
+        }
+        # The same booking can appear in several feeds
+        key = tuple(str(projected.get(field, activity.get(field, ''))).strip().lower() for field in dedupe_fields)
+        if key in seen:
+            continue
+        seen.add(key)
+        if not include_user:
+            del projected['brugernavn']
+        projected_activities.append({field: value for field, value in projected.items() if value})
+
+    projected_activities.sort(key=lambda a: str(a.get('fratid', '')))
+    return projected_activities
+
+def json_feed_lock(url):
+    """One lock per upstream URL so concurrent screens wait for a single fetch"""
+    with json_feed_locks_guard:
+        return json_feed_locks.setdefault(url, threading.Lock())
+
+def remembered_failure(failure):
+    """A fresh exception for a remembered feed failure - one shared instance raised from many threads would pile up tracebacks"""
+    _, error_type, message, response = failure
+    if issubclass(error_type, requests.exceptions.HTTPError):
+        return requests.exceptions.HTTPError(message, response=response)
+    if issubclass(error_type, requests.exceptions.Timeout):
+        return requests.exceptions.Timeout(message)
+    return requests.exceptions.RequestException(message)
+
+def fetch_json_feed(url):
+    """Cached feed entry for a URL - upstream is fetched (or a failure remembered) at most once per JSON_FEED_TTL"""
+    lock = json_feed_lock(url)
+    entry = json_feed_cache.get(url)
+    if entry and not lock.acquire(blocking=False):
+        return entry  # Another request is refreshing this feed - serve what we have
+    if not entry:
+        lock.acquire()
+    try:
+        entry = json_feed_cache.get(url)
+        failure = json_feed_failures.get(url)
+        if failure and time.time() - failure[0] < JSON_FEED_TTL:
+            raise remembered_failure(failure)
+        if not entry or time.time() - entry['fetched_at'] >= JSON_FEED_TTL:
+            try:
+                response = json_feed_session.get(url, timeout=JSON_FEED_TIMEOUT)
+                response.raise_for_status()
+                entry = {'fetched_at': time.time(), 'activities': extract_activities(response.json())}
+            except Exception as e:
+                json_feed_failures[url] = (time.time(), type(e), str(e), getattr(e, 'response', None))
+                raise
+            json_feed_cache[url] = entry
+            json_feed_failures.pop(url, None)
+        return entry
+    finally:
+        lock.release()
+
+def get_json_feed(urls, json_template, dedupe_key=None):
+    """Merged, projected activities and content hash for one or more feeds fetched concurrently"""
+    if isinstance(urls, str):
+        urls = [urls]
+    futures = {json_feed_executor.submit(fetch_json_feed, url): url for url in urls}
+    done, _ = wait(futures, timeout=JSON_FEED_TIMEOUT + JSON_FEED_WAIT_MARGIN)
+
+    entries = []
+    first_error = None
+    for future, url in futures.items():
+        if future in done and not future.exception():
+            entries.append((url, future.result()))
+            continue
+        if future in done:
+            error = future.exception()
+        else:
+            error = requests.exceptions.Timeout(f'No response within {JSON_FEED_TIMEOUT}s')
+        first_error = first_error or error
+        stale = json_feed_cache.get(url)
+        logger.warning(f"JSON feed {url} failed ({error}) - {'using stale data' if stale else 'skipped'}")
+        if stale:
+            entries.append((url, stale))
+    if not entries:
+        raise first_error
+
+    key = (tuple(urls), json_template, dedupe_key)
+    versions = tuple((url, entry['fetched_at']) for url, entry in entries)
+    projection = json_feed_projections.get(key)
+    if not projection or projection[0] != versions:
+        merged = [activity for _, entry in entries for activity in entry['activities']]
+        activities = project_activities(merged, json_template, dedupe_key)
+        payload = json.dumps(activities, sort_keys=True, separators=(',', ':'))
+        projection = (versions, activities, hashlib.sha1(payload.encode()).hexdigest()[:16])
+        json_feed_projections[key] = projection
+    return projection[1], projection[2]
+
+# ========== RESPONSE COMPRESSION ==========
+
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))  # Bytes - smaller bodies are not worth the CPU
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))  # gzip level; brotli uses a fast quality for dynamic bodies
+COMPRESSIBLE_MIMETYPES = {'text/html', 'text/css', 'text/plain', 'text/javascript', 'application/javascript',
+                          'application/json', 'image/svg+xml'}
+PRECOMPRESSED_EXTENSIONS = {'.css', '.js', '.json', '.svg', '.html', '.txt'}
+BROTLI_AVAILABLE = importlib.util.find_spec('brotli') is not None
+
+def accepted_encodings():
+    """Content codings the client accepts (q=0 excluded), brotli only when the module is installed"""
+    accepted = set()
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(coding.strip().lower())
+    if not BROTLI_AVAILABLE:
+        accepted.discard('br')
+    return accepted
+
+def compress_response(response):
+    """Compress dynamic text responses (dashboard, JSON APIs) when the client accepts it"""
+    if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+            or response.status_code in (204, 206, 304) or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+
+    accepted = accepted_encodings()
+    if 'br' in accepted:
+        import brotli
+        response.set_data(brotli.compress(body, quality=5))
+        response.headers['Content-Encoding'] = 'br'
+    elif 'gzip' in accepted:
+        import gzip
+        response.set_data(gzip.compress(body, compresslevel=COMPRESS_LEVEL))
+        response.headers['Content-Encoding'] = 'gzip'
+    etag = response.headers.get('ETag')
+    if 'Content-Encoding' in response.headers and etag and not etag.startswith('W/'):
+        # The encoded bytes differ from the identity body - a strong validator would claim they are the same
+        response.headers['ETag'] = f'W/{etag}'
+    return response
+
+def send_precompressed(directory, filename, **kwargs):
+    """send_from_directory, preferring a precompressed .br/.gz sibling the client accepts"""
+    import mimetypes
+    accepted = accepted_encodings()
+    for coding, extension in (('br', '.br'), ('gzip', '.gz')):
+        if coding in accepted and os.path.isfile(os.path.join(directory, filename + extension)):
+            response = send_from_directory(directory, filename + extension,
+                                           mimetype=mimetypes.guess_type(filename)[0], **kwargs)
+            response.headers['Content-Encoding'] = coding
+            response.headers.pop('Content-Disposition', None)
+            response.vary.add('Accept-Encoding')
+            return response
+    return send_from_directory(directory, filename, **kwargs)
+
+def serve_static(filename):
+    """Static files - send the precompressed variant when the client accepts it"""
+    return send_precompressed(current_app.static_folder, filename, max_age=current_app.get_send_file_max_age(filename))
+
+def precompress_static(static_folder):
+    """Write .gz and .br next to static text assets that are missing or older than their source"""
+    import gzip
+    if BROTLI_AVAILABLE:
+        import brotli
+
+    written = 0
+    for root, _, files in os.walk(static_folder):
+        for name in files:
+            if os.path.splitext(name)[1] not in PRECOMPRESSED_EXTENSIONS:
+                continue
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                body = f.read()
+            if len(body) < COMPRESS_MIN_SIZE:
+                continue
+            variants = [('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+            if BROTLI_AVAILABLE:
+                variants.append(('.br', lambda data: brotli.compress(data, quality=11)))
+            for extension, compress in variants:
+                target = path + extension
+                if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+                    continue
+                compressed = compress(body)
+                if len(compressed) >= len(body):
+                    continue
+                try:
+                    with open(target, 'wb') as f:
+                        f.write(compressed)
+                    written += 1
+                except OSError as e:
+                    # Read-only static mount (compose dev setup) - static files are then sent uncompressed
+                    logger.warning(f"Could not precompress {path}: {e}")
+                    return written
+    if written:
+        logger.info(f"Precompressed {written} static files")
+    return written
+
+# ========== PRECOMPUTED DISPLAY PAGES ==========
+
+DISPLAY_CACHE_FOLDER = os.environ.get('DISPLAY_CACHE_FOLDER', '/app/data/display_cache')  # nginx can serve <uuid>.html from here
+DISPLAY_CACHE_ENABLED = os.environ.get('DISPLAY_CACHE_ENABLED', 'true').lower() == 'true'
+DISPLAY_CACHE_STAMP = os.path.join(DISPLAY_CACHE_FOLDER, '.invalidated')
+os.makedirs(DISPLAY_CACHE_FOLDER, exist_ok=True)
+
+def display_page_filename(screen):
+    return f"{screen.uuid}.html"
+
+def invalidate_display_pages(screen=None):
+    """Drop the cached display page for one screen, or for all screens when media/global settings change"""
+    try:
+        # Renders that started before this moment must not store their (stale) result.
+        # Also the start of the staggered reload rollout, so it's written even with the cache disabled.
+        with open(DISPLAY_CACHE_STAMP, 'w') as f:
+            f.write(str(time.time()))
+        if not DISPLAY_CACHE_ENABLED:
+            return
+        if screen:
+            names = [display_page_filename(screen)]
+        else:
+            names = [name for name in os.listdir(DISPLAY_CACHE_FOLDER) if name.endswith('.html')]
+        for name in names:
+            for suffix in ('', '.gz', '.br'):
+                try:
+                    os.remove(os.path.join(DISPLAY_CACHE_FOLDER, name + suffix))
+                except FileNotFoundError:
+                    pass
+    except OSError as e:
+        logger.warning(f"Could not invalidate display cache: {e}")
+
+def cached_display_page(screen):
+    """Response for a precomputed display page, or None when it has to be rendered"""
+    if not DISPLAY_CACHE_ENABLED or not os.path.exists(os.path.join(DISPLAY_CACHE_FOLDER, display_page_filename(screen))):
+        return None
+    response = send_precompressed(DISPLAY_CACHE_FOLDER, display_page_filename(screen), max_age=0)
+    response.headers['Cache-Control'] = 'no-cache'  # Always revalidate - a 304 costs no rendering
+    return response
+
+def store_display_page(screen, html, render_started):
+    """Write a rendered display page (plus .gz/.br) to the cache - skipped if invalidated while rendering"""
+    import gzip
+    if not DISPLAY_CACHE_ENABLED:
+        return
+    try:
+        if os.path.exists(DISPLAY_CACHE_STAMP) and os.path.getmtime(DISPLAY_CACHE_STAMP) >= render_started:
+            return
+        body = html.encode()
+        variants = [('', body), ('.gz', gzip.compress(body, compresslevel=9, mtime=0))]
+        if BROTLI_AVAILABLE:
+            import brotli
+            variants.append(('.br', brotli.compress(body, quality=11)))
+        path = os.path.join(DISPLAY_CACHE_FOLDER, display_page_filename(screen))
+        # Compressed variants first, the plain file last - its presence marks the page as cached
+        for suffix, data in reversed(variants):
+            tmp_path = f"{path}{suffix}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path + suffix)
+    except OSError as e:
+        logger.warning(f"Could not cache display page for {screen.name}: {e}")
+
+# ========== RELOAD ROLLOUT AND ADMISSION ==========
+
+RELOAD_ROLLOUT_SECONDS = int(os.environ.get('RELOAD_ROLLOUT_SECONDS', 120))  # Reloads after a change are spread over this
+DISPLAY_ADMISSION_RATE = float(os.environ.get('DISPLAY_ADMISSION_RATE', 10))  # Page loads/s per worker, 0 = unlimited
+DISPLAY_ADMISSION_BURST = int(os.environ.get('DISPLAY_ADMISSION_BURST', 30))
+DISPLAY_RETRY_JITTER = int(os.environ.get('DISPLAY_RETRY_JITTER', 10))  # Extra random seconds on Retry-After
+ROLLOUT_ENDPOINTS = {'api_media_list', 'api_screen_settings', 'redirect_check'}  # Polls that can trigger a reload
+DEFERRED_DISPLAY_PAGE = (
+    '<!DOCTYPE html><html><head><meta charset="utf-8"><meta http-equiv="refresh" content="{seconds}">'
+    '<title>Infoskærm</title></head><body style="background:#000"></body></html>'
+)
+
+class TokenBucket:
+    """Admits `rate` requests per second on average with bursts up to `burst`"""
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        """0 if admitted, otherwise the seconds until a token is available"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+display_admission = TokenBucket(DISPLAY_ADMISSION_RATE, DISPLAY_ADMISSION_BURST) if DISPLAY_ADMISSION_RATE > 0 else None
+
+def admit_display_load():
+    """None if the page load may go ahead, otherwise a 503 that retries after a jittered delay"""
+    wait_seconds = display_admission.take() if display_admission else 0
+    if not wait_seconds:
+        return None
+    retry_after = int(wait_seconds) + 1 + random.randint(0, DISPLAY_RETRY_JITTER)
+    response = current_app.response_class(DEFERRED_DISPLAY_PAGE.format(seconds=retry_after), status=503,
+                                          mimetype='text/html')
+    response.headers['Retry-After'] = str(retry_after)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+def reload_delay(key):
+    """Seconds until this screen's slot in the rollout of the latest change - 0 once it has passed"""
+    try:
+        changed_at = os.path.getmtime(DISPLAY_CACHE_STAMP)
+    except OSError:
+        return 0
+    # Same slot for the same screen and change in every worker, different slots across screens
+    digest = hashlib.sha1(f'{key}:{changed_at}'.encode()).digest()
+    slot = int.from_bytes(digest[:4], 'big') / 0xFFFFFFFF * RELOAD_ROLLOUT_SECONDS
+    return max(0, int(changed_at + slot - time.time()))
+
+def add_reload_delay(response):
+    """Tell polling screens when to apply a change they detect (X-Reload-In, seconds)"""
+    if request.endpoint in ROLLOUT_ENDPOINTS and RELOAD_ROLLOUT_SECONDS > 0:
+        key = ((request.view_args or {}).get('screen_uuid') or request.args.get('screen')
+               or request.headers.get('X-Real-IP') or request.remote_addr)
+        response.headers['X-Reload-In'] = str(reload_delay(key))
+    return response
+
+# ========== BROADCASTS ==========
+
+BROADCAST_STAMP = os.environ.get('BROADCAST_STAMP', '/app/data/broadcast.stamp')  # Touched by the admin app on every change
+BROADCAST_CHECK_INTERVAL = float(os.environ.get('BROADCAST_CHECK_INTERVAL', 0.5))  # Seconds between stamp checks per worker
+BROADCAST_HEARTBEAT = 15  # Seconds between keep-alive comments on an idle stream
+BROADCAST_STREAM_SECONDS = 3600  # Streams are reopened after this, so workers recycle cleanly
+BROADCAST_LONG_POLL_SECONDS = 25  # Threaded workers hold a stream this long, then the screen reconnects after 1s
+BROADCAST_LONG_POLL_SLOTS = int(os.environ.get('BROADCAST_LONG_POLL_SLOTS', 8))  # Held streams per worker - keeps threads free for admin pages
+BROADCAST_POLL_SECONDS = int(os.environ.get('BROADCAST_POLL_SECONDS', 60))  # Reconnect delay when no stream can be held
+long_poll_slots = threading.BoundedSemaphore(BROADCAST_LONG_POLL_SLOTS)
+
+class BroadcastState:
+    """Active broadcasts of this worker, reloaded when the stamp changes or one expires"""
+    def __init__(self):
+        self.version = 0
+        self.broadcasts = []
+        self.stamp = None
+        self.next_expiry = None
+        self.changed = threading.Condition()
+        self.watcher = None
+        self.lock = threading.Lock()
+
+broadcast_state = BroadcastState()
+
+def notify_broadcasts():
+    """Tell every worker (admin app and player service) that broadcasts changed"""
+    try:
+        with open(BROADCAST_STAMP, 'w') as f:
+            f.write(str(time.time()))
+    except OSError as e:
+        logger.warning(f"Could not write broadcast stamp: {e}")
+
+def load_broadcasts():
+    """Active broadcasts as plain dicts - newest last"""
+    from models import Broadcast
+    now = datetime.utcnow()
+    rows = Broadcast.query.filter(Broadcast.cancelled.is_(False), Broadcast.expires_at > now).order_by(Broadcast.id).all()
+    return [{
+        'id': row.id,
+        'message': row.message or '',
+        'image': row.image_path or '',
+        'url': row.url or '',
+        'expires_at': (row.expires_at - datetime(1970, 1, 1)).total_seconds(),
+        'targets': row.target_uuids(),
+    } for row in rows]
+
+def refresh_broadcasts(stamp):
+    state = broadcast_state
+    broadcasts = load_broadcasts()
+    db.session.remove()
+    with state.changed:
+        state.stamp = stamp
+        state.broadcasts = broadcasts
+        state.next_expiry = min((b['expires_at'] for b in broadcasts), default=None)
+        state.version += 1
+        state.changed.notify_all()
+
+def broadcast_stamp():
+    try:
+        return os.path.getmtime(BROADCAST_STAMP)
+    except OSError:
+        return 0
+
+def watch_broadcasts(app):
+    """Background loop: a stat() per interval, a query only when something changed"""
+    state = broadcast_state
+    while True:
+        time.sleep(BROADCAST_CHECK_INTERVAL)
+        stamp = broadcast_stamp()
+        if stamp == state.stamp and not (state.next_expiry and time.time() >= state.next_expiry):
+            continue
+        try:
+            with app.app_context():
+                refresh_broadcasts(stamp)
+        except Exception as e:
+            logger.warning(f"Could not reload broadcasts: {e}")
+
+def ensure_broadcast_watcher():
+    """Load broadcasts and start the watcher on the first stream in this worker"""
+    state = broadcast_state
+    with state.lock:
+        if state.watcher:
+            return
+        refresh_broadcasts(broadcast_stamp())
+        state.watcher = threading.Thread(target=watch_broadcasts, args=(current_app._get_current_object(),),
+                                         daemon=True, name='broadcast-watcher')
+        state.watcher.start()
+
+def long_lived_streams():
+    """Hold streams open only on gevent workers - on a sync worker one screen would occupy it"""
+    try:
+        from gevent import monkey
+        return monkey.is_module_patched('socket')
+    except ImportError:
+        return False
+
+def broadcasts_for(screen_uuid, broadcasts):
+    """What one screen should show - expiry as seconds from now, so screen clocks don't matter"""
+    now = time.time()
+    return [{
+        'id': b['id'], 'message': b['message'], 'image': b['image'], 'url': b['url'],
+        'expires_in': round(b['expires_at'] - now, 1),
+    } for b in broadcasts if (b['targets'] is None or screen_uuid in b['targets']) and b['expires_at'] > now]
+
+def api_broadcast_stream():
+    """Server-Sent Events with the broadcasts for ?screen=<uuid> - pushed within BROADCAST_CHECK_INTERVAL"""
+    screen_uuid = request.args.get('screen', '')
+    ensure_broadcast_watcher()
+    db.session.close()
+    state = broadcast_state
+
+    # gevent: one open stream per screen. Threaded workers (gthread, the Dockerfile default): a bounded
+    # long-poll while a slot is free. Plain sync workers or no free slot: one answer, poll again later
+    slot = None
+    if long_lived_streams():
+        hold_seconds, retry_ms = BROADCAST_STREAM_SECONDS, 2000
+    elif request.environ.get('wsgi.multithread') and long_poll_slots.acquire(blocking=False):
+        slot = long_poll_slots
+        hold_seconds, retry_ms = BROADCAST_LONG_POLL_SECONDS, 1000
+    else:
+        hold_seconds, retry_ms = 0, BROADCAST_POLL_SECONDS * 1000
+
+    def events():
+        sent_version = None
+        deadline = time.monotonic() + hold_seconds
+        yield f"retry: {retry_ms}\n\n"
+        while True:
+            with state.changed:
+                if state.version == sent_version:
+                    state.changed.wait(max(0, min(BROADCAST_HEARTBEAT, deadline - time.monotonic())))
+                version, broadcasts = state.version, state.broadcasts
+            if version != sent_version:
+                sent_version = version
+                yield f"event: broadcast\ndata: {json.dumps(broadcasts_for(screen_uuid, broadcasts))}\n\n"
+            else:
+                yield ": ping\n\n"
+            if time.monotonic() >= deadline:
+                return
+
+    response = current_app.response_class(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # nginx: pass events through as they are written
+    })
+    if slot:
+        response.call_on_close(slot.release)
+    return response
+
+# ========== PLAYBACK STATS ==========
+
+PLAYBACK_PRELOAD_AHEAD = int(os.environ.get('PLAYBACK_PRELOAD_AHEAD', 2))  # Items display.html loads and decodes ahead
+PLAYBACK_PRELOAD_BUDGET_MB = int(os.environ.get('PLAYBACK_PRELOAD_BUDGET_MB', 150))  # Estimated memory for those items
+PLAYBACK_READY_TIMEOUT = int(os.environ.get('PLAYBACK_READY_TIMEOUT', 15))  # Seconds an item may take to load before it's skipped
+PLAYBACK_REPORT_SECONDS = int(os.environ.get('PLAYBACK_REPORT_SECONDS', 300))  # How often a screen sends its timings
+PLAYBACK_SLOW_MS = int(os.environ.get('PLAYBACK_SLOW_MS', 1000))  # p95 time to first frame above this is logged as a warning
+PLAYBACK_MAX_ITEMS = 500  # Per report - anything beyond is ignored
+
+def playback_config():
+    """Preload settings rendered into display.html"""
+    return {
+        'preload_ahead': PLAYBACK_PRELOAD_AHEAD,
+        'preload_budget_mb': PLAYBACK_PRELOAD_BUDGET_MB,
+        'ready_timeout_seconds': PLAYBACK_READY_TIMEOUT,
+        'report_seconds': PLAYBACK_REPORT_SECONDS,
+    }
+
+def percentile(values, fraction):
+    """Percentile of sorted values, nearest index"""
+    return values[round((len(values) - 1) * fraction)]
+
+def is_measurement(value, kind=(int, float)):
+    """A finite number from a report - JSON booleans, NaN and Infinity also parse as numbers"""
+    return isinstance(value, kind) and not isinstance(value, bool) and math.isfinite(value)
+
+def api_playback_stats():
+    """Time-to-first-frame report from a display - logged, never stored (the player is read-only)"""
+    data = request.get_json(silent=True) or {}
+    items = data.get('items')
+    if not isinstance(items, list):
+        return jsonify({'error': 'items must be a list'}), 400
+
+    items = [item for item in items[:PLAYBACK_MAX_ITEMS] if isinstance(item, dict)]
+    timed = [item for item in items if is_measurement(item.get('ttff_ms'))]
+    if not timed:
+        return '', 204
+
+    timings = sorted(item['ttff_ms'] for item in timed)
+    slowest = max(timed, key=lambda item: item['ttff_ms'])
+    screen = str(data.get('screen') or 'global')[:36]
+    fields = {
+        'screen': screen,
+        'items': len(items),
+        'errors': len(items) - len(timed),
+        'cold': sum(1 for item in timed if not item.get('preloaded')),
+        'stalls': sum(item['stalls'] for item in timed if is_measurement(item.get('stalls'), int)),
+        'p50_ms': percentile(timings, 0.5),
+        'p95_ms': percentile(timings, 0.95),
+        'max_ms': timings[-1],
+        'slowest': str(slowest.get('path'))[:200],
+    }
+    level = logging.WARNING if fields['p95_ms'] > PLAYBACK_SLOW_MS or fields['errors'] else logging.INFO
+    log_event(logger, 'screen.playback', screen,
+              'Playback {screen}: {items} items, first frame p50 {p50_ms}ms p95 {p95_ms}ms max {max_ms}ms '
+              '({cold} not preloaded, {stalls} stalls, {errors} errors) - slowest {slowest}',
+              level=level, **fields)
+    return '', 204
+
+# ========== PLAYER ROUTES ==========
+
+def inject_settings():
+    """Make settings available to all templates"""
+    settings_dict = {}
+    for setting in Settings.query.all():
+        settings_dict[setting.key] = setting.value
+    return dict(site_settings=settings_dict, playback=playback_config())
+
+def serve_media(filename):
+    """Serve optimized media files"""
+    return send_from_directory(current_app.config['OPTIMIZED_FOLDER'], filename)
+
+def serve_uploads(filename):
+    """Serve uploaded files (e.g., sponsor logos)"""
+    return send_from_directory(current_app.config['UPLOAD_FOLDER'], filename)
+
+def api_media_list():
+    """API endpoint for media list"""
+    media_files = Media.query.filter_by(active=True).order_by(Media.order_index, Media.uploaded_at.desc()).all()
+
+    media_list = []
+    for media in media_files:
+        media_list.append({
+            'type': media.media_type,
+            'path': f'/media/{media.filename}',
+            'duration': media.duration,
+            'size': media.file_size,
+            'stream': f'/media/{media.stream_playlist}' if media.stream_playlist else None
+        })
+
+    return jsonify(media_list)
+
+def api_screen_settings(screen_uuid):
+    """API endpoint for screen settings - used by display pages for periodic checks"""
+    try:
+        screen = Screen.query.filter_by(uuid=screen_uuid).first()
+        if not screen:
+            return jsonify({'error': 'Screen not found'}), 404
+
+        carousel_sponsors = []
+        if screen.carousel_enabled:
+            carousel_sponsors = [s.filename for s in screen.carousel_sponsors]
+
+        return jsonify({
+            'display_mode': screen.display_mode,
+            'json_template': screen.json_template,
+            'carousel_enabled': screen.carousel_enabled,
+            'carousel_speed': screen.carousel_speed or 'medium',
+            'carousel_sponsors_count': len(carousel_sponsors),
+            'magion_logo': screen.magion_logo_path,
+            'sponsor_logo': screen.sponsor_logo_path
+        })
+    except Exception as e:
+        logger.error(f"Error getting screen settings: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def api_screen_json_data(screen_uuid):
+    """API endpoint for JSON data - used by display_json.html for periodic data refresh"""
+    try:
+        screen = Screen.query.filter_by(uuid=screen_uuid).first()
+        if not screen:
+            return jsonify({'error': 'Screen not found'}), 404
+
+        if not screen.json_api_url:
+            return jsonify({'error': 'No JSON API URL configured'}), 400
+
+        feed_urls = screen_feed_urls(screen)
+        json_template, dedupe_key = screen.json_template or 'schedule', screen.json_dedupe_key
+        # Hand the pooled DB connection back before a possibly slow upstream fetch
+        db.session.close()
+
+        # Projected feed shared by every screen on the same URL and template
+        try:
+            activities, data_hash = get_json_feed(feed_urls, json_template, dedupe_key)
+            etag = f'"{data_hash}"'
+            # Weak match - compressed responses carry W/"hash"
+            if request.if_none_match.contains_weak(data_hash):
+                return '', 304, {'ETag': etag if request.if_none_match.contains(data_hash) else f'W/{etag}'}
+            if request.args.get('hash') == data_hash:
+                # Client already renders this data - skip the payload
+                return jsonify({'success': True, 'not_modified': True, 'hash': data_hash})
+
+            response = jsonify({
+                'success': True,
+                'data': activities,
+                'hash': data_hash,
+                'timestamp': datetime.utcnow().isoformat()
+            })
+            response.headers['ETag'] = etag
+            return response
+        except requests.exceptions.HTTPError as e:
+            status_code = e.response.status_code
+            logger.error(f"JSON API returned status {status_code}")
+            return jsonify({
+                'success': False,
+                'error': f'API returned status {status_code}'
+            }), status_code
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to fetch JSON API: {e}")
+            return jsonify({
+                'success': False,
+                'error': 'Network error fetching JSON data',
+                'details': str(e)
+            }), 503
+    except Exception as e:
+        logger.error(f"Error in JSON data endpoint: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def redirect_check():
+    """API endpoint to check redirect status - used by display.html for periodic checks"""
+    redirect_enabled = Settings.query.filter_by(key='redirect_enabled').first()
+    redirect_url = Settings.query.filter_by(key='redirect_url').first()
+
+    return jsonify({
+        'redirect_enabled': redirect_enabled.value == 'True' if redirect_enabled else False,
+        'redirect_url': redirect_url.value if redirect_url else ''
+    })
+
+def track_screen_access(screen):
+    """Record the WAN/LAN IP and time of the latest display load"""
+    try:
+        # Get WAN IP (from proxy/X-Forwarded-For)
+        wan_ip = request.headers.get('X-Forwarded-For')
+        if wan_ip and ',' in wan_ip:
+            # X-Forwarded-For can contain multiple IPs, take the first one
+            wan_ip = wan_ip.split(',')[0].strip()
+
+        # Get LAN IP (from X-Real-IP header set by nginx proxy)
+        # Falls back to request.remote_addr if header not present
+        lan_ip = request.headers.get('X-Real-IP') or request.remote_addr
+
+        # Update screen access info
+        screen.last_access_ip = wan_ip if wan_ip else lan_ip  # WAN IP (or LAN if no proxy)
+        screen.last_access_lan_ip = lan_ip  # Always save LAN IP
+        screen.last_access_time = datetime.utcnow()
+        db.session.commit()
+
+        log_event(logger, 'screen.access', screen.uuid, 'Screen {screen} accessed - WAN: {wan_ip}, LAN: {lan_ip}',
+                  screen=screen.name, screen_uuid=screen.uuid, wan_ip=wan_ip or 'N/A', lan_ip=lan_ip)
+    except Exception as e:
+        logger.warning(f"Failed to update screen access info: {e}")
+        # Don't fail the request if IP tracking fails
+        db.session.rollback()
+
+def display_screen(screen_uuid):
+    """Display screen by UUID - shows screen-specific content"""
+    # Shed reload storms before they reach the database
+    deferred = admit_display_load()
+    if deferred:
+        return deferred
+
+    screen = Screen.query.filter_by(uuid=str(screen_uuid)).first_or_404()
+
+    # Track IP address and last access time - the read-only player service can't write, so page loads
+    # served there are not recorded (last access only reflects loads that went through the admin app)
+    if not current_app.config.get('DATABASE_READ_ONLY'):
+        track_screen_access(screen)
+
+    # Check display mode and handle accordingly
+    display_mode = screen.display_mode or 'media'
+
+    # Legacy support: if redirect_enabled is True, use redirect mode
+    if screen.redirect_enabled and screen.redirect_url:
+        display_mode = 'redirect'
+
+    # Handle different display modes
+    if display_mode == 'redirect' and screen.redirect_url:
+        log_event(logger, 'screen.mode', screen.uuid, 'Screen {screen} redirect mode - redirecting to: {url}',
+                  screen=screen.name, screen_uuid=screen.uuid, mode='redirect', url=screen.redirect_url)
+        return redirect(screen.redirect_url)
+
+    elif display_mode == 'json_api' and screen.json_api_url:
+        log_event(logger, 'screen.mode', screen.uuid, 'Screen {screen} JSON API mode - fetching from: {url}',
+                  screen=screen.name, screen_uuid=screen.uuid, mode='json_api', url=screen.json_api_url)
+        # Get carousel sponsors if enabled
+        carousel_sponsors = []
+        carousel_sprite = None
+        if screen.carousel_enabled:
+            carousel_sponsors = [s.filename for s in screen.carousel_sponsors]
+            if screen.carousel_sprite_path and screen.carousel_sprite_map:
+                # One sprite sheet instead of one request per logo
+                carousel_sprite = dict(json.loads(screen.carousel_sprite_map), url=screen.carousel_sprite_path)
+
+        # Hand the pooled DB connection back before a possibly slow upstream fetch
+        db.session.close()
+
+        # Fetch JSON data (projected and shared with the json-data endpoint)
+        try:
+            json_data, json_hash = get_json_feed(screen_feed_urls(screen), screen.json_template or 'schedule',
+                                                 screen.json_dedupe_key)
+        except Exception as e:
+            logger.error(f"Failed to fetch JSON API: {e}")
+            json_data, json_hash = [], ''
+
+        return render_template('display_json.html',
+                             json_data=json.dumps(json_data),
+                             json_hash=json_hash,
+                             json_template=screen.json_template or 'schedule',
+                             screen_name=screen.name,
+                             screen_uuid=str(screen_uuid),
+                             sponsor_logo=screen.sponsor_logo_path,
+                             magion_logo=screen.magion_logo_path,
+                             carousel_enabled=screen.carousel_enabled,
+                             carousel_speed=screen.carousel_speed or 'medium',
+                             carousel_sponsors=carousel_sponsors,
+                             carousel_sprite=carousel_sprite)
+
+    # Media and iframe pages only change with the playlist/settings - serve the precomputed page
+    cached = cached_display_page(screen)
+    if cached:
+        return cached
+
+    render_started = time.time()
+    html = render_display_page(screen, display_mode)
+    store_display_page(screen, html, render_started)
+    return cached_display_page(screen) or html
+
+def render_display_page(screen, display_mode):
+    """Render the display HTML for a media or iframe mode screen"""
+    screen_uuid = screen.uuid
+    if display_mode == 'iframe' and screen.iframe_url:
+        log_event(logger, 'screen.mode', screen.uuid, 'Screen {screen} iframe mode - showing: {url}',
+                  screen=screen.name, screen_uuid=screen.uuid, mode='iframe', url=screen.iframe_url)
+        return render_template('display_iframe.html',
+                             iframe_url=screen.iframe_url,
+                             iframe_margin_left=screen.iframe_margin_left or 0,
+                             iframe_margin_right=screen.iframe_margin_right or 0,
+                             screen_name=screen.name,
+                             screen_uuid=str(screen_uuid))
+
+    # Default: media rotation mode
+    if not screen.active:
+        return render_template('display.html',
+                             media_list=json.dumps([]),
+                             screen_name=screen.name,
+                             screen_inactive=True)
+
+    media_list = []
+
+    # Get screen-specific media with custom durations
+    if screen.media_associations:
+        for assoc in screen.media_associations:
+            media = assoc.media
+            if media and media.active:
+                # Use screen-specific duration if set, otherwise use media default
+                duration = assoc.duration if assoc.duration else media.duration
+                media_list.append({
+                    'type': media.media_type,
+                    'path': f'/media/{media.filename}',
+                    'duration': duration,
+                    'size': media.file_size,
+                    'stream': f'/media/{media.stream_playlist}' if media.stream_playlist else None
+                })
+    else:
+        # No screen-specific media, use global media
+        global_media = Media.query.filter_by(active=True, is_global=True).order_by(
+            Media.order_index, Media.uploaded_at.desc()
+        ).all()
+
+        for media in global_media:
+            media_list.append({
+                'type': media.media_type,
+                'path': f'/media/{media.filename}',
+                'duration': media.duration,
+                'size': media.file_size,
+                'stream': f'/media/{media.stream_playlist}' if media.stream_playlist else None
+            })
+
+    return render_template('display.html',
+                         media_list=json.dumps(media_list),
+                         screen_name=screen.name,
+                         screen_uuid=str(screen_uuid))
+
+def health():
+    """Health check endpoint for Docker"""
+    return jsonify({'status': 'healthy', 'timestamp': datetime.utcnow().isoformat()})
+
+def init_player(app):
+    """Register the player routes, template settings, compression and static handling on an app"""
+    app.add_url_rule('/screen/<uuid:screen_uuid>', view_func=display_screen)
+    app.add_url_rule('/media/<path:filename>', view_func=serve_media)  # path: HLS segments live in <name>.hls/
+    app.add_url_rule('/uploads/<path:filename>', view_func=serve_uploads)
+    app.add_url_rule('/api/media-list', view_func=api_media_list)
+    app.add_url_rule('/api/screen/<screen_uuid>/settings', view_func=api_screen_settings)
+    app.add_url_rule('/api/screen/<screen_uuid>/json-data', view_func=api_screen_json_data)
+    app.add_url_rule('/api/redirect-check', view_func=redirect_check)
+    app.add_url_rule('/api/broadcasts/stream', view_func=api_broadcast_stream)
+    app.add_url_rule('/api/playback-stats', view_func=api_playback_stats, methods=['POST'])
+    app.context_processor(inject_settings)
+    app.after_request(add_reload_delay)
+    app.after_request(compress_response)
+    app.view_functions['static'] = serve_static
+
+def create_app():
+    """Standalone player service - read-only database, no login, uploads or media processing"""
+    from models import configure_database
+    from profiling import init_profiling
+    configure_logging()
+
+    app = Flask(__name__)
+    FlaskUUID(app)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER', '/app/uploads')
+    app.config['OPTIMIZED_FOLDER'] = os.environ.get('OPTIMIZED_FOLDER', '/app/optimized')
+    configure_database(app, read_only=True)
+    init_profiling(app)
+    init_player(app)
+    app.add_url_rule('/health', view_func=health)
+    return app
@@ -0,0 +1,207 @@
+"""
+Request profiling - cProfile and SQL timing for single requests, browsed at /profiles
+
+A request is profiled when a logged-in admin adds ?profile=1 (or an X-Profile: 1 header),
+when the flag equals PROFILE_TOKEN (the player service and screens have no login), or for a
+random PROFILE_SAMPLE_RATE share of all requests. The last PROFILE_KEEP profiles are kept
+in PROFILE_FOLDER as a JSON summary plus the raw .prof file (snakeviz, pstats).
+
+Requests that aren't profiled only pay for the flag lookup; the SQLAlchemy listeners are
+installed on the first profiled request.
+"""
+import cProfile
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime
+from flask import current_app, g, request
+from sqlalchemy import event
+from models import db
+
+logger = logging.getLogger(__name__)
+
+PROFILE_FOLDER = os.environ.get('PROFILE_FOLDER', '/app/data/profiles')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))  # 0.01 = one request in a hundred
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 50))
+PROFILE_TOP_FUNCTIONS = 60
+PROFILE_MAX_QUERIES = 500  # Statements stored per profile - the totals still count all of them
+PROFILE_ID_PATTERN = re.compile(r'^\d{8}-\d{6}-\d{6}-[0-9a-f]{6}$')
+profile_queries = threading.local()  # .queries is a list only while this thread's request is profiled
+profiled_engines = set()
+profiled_engines_lock = threading.Lock()
+
+def is_admin_request():
+    """Logged-in admin on the admin app - the player service has no login manager"""
+    if not hasattr(current_app, 'login_manager'):
+        return False
+    from flask_login import current_user
+    return current_user.is_authenticated and (current_user.role == 'admin' or current_user.is_admin)
+
+def profile_trigger():
+    """Why this request is profiled ('admin', 'token', 'sample') - None for almost every request"""
+    flag = request.headers.get('X-Profile') or request.args.get('profile')
+    if flag:
+        if PROFILE_TOKEN and flag == PROFILE_TOKEN:
+            return 'token'
+        return 'admin' if is_admin_request() else None
+    if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        return 'sample'
+    return None
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if getattr(profile_queries, 'queries', None) is not None:
+        conn.info.setdefault('profile_query_start', []).append(time.perf_counter())
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    queries = getattr(profile_queries, 'queries', None)
+    starts = conn.info.get('profile_query_start')
+    if queries is not None and starts:
+        # Statements only - parameters can hold password hashes and session data
+        queries.append((statement, (time.perf_counter() - starts.pop()) * 1000, executemany))
+
+def install_query_listeners():
+    """Time SQL statements on this app's engine - done once, on the first profiled request"""
+    engine = db.engine
+    with profiled_engines_lock:
+        if engine in profiled_engines:
+            return
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+        profiled_engines.add(engine)
+
+def start_profile():
+    """before_request: start cProfile and query timing if this request should be profiled"""
+    trigger = profile_trigger()
+    if not trigger:
+        return
+    install_query_listeners()
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # Another profiler is already active in this thread
+        return
+    profile_queries.queries = []
+    g.profile = {'trigger': trigger, 'profiler': profiler, 'started': time.perf_counter()}
+
+def finish_profile(response):
+    """after_request: stop profiling and store the profile"""
+    profile = g.pop('profile', None)
+    if not profile:
+        return response
+    profile['profiler'].disable()
+    duration_ms = (time.perf_counter() - profile['started']) * 1000
+    queries = profile_queries.queries
+    profile_queries.queries = None
+
+    profile_id = f"{datetime.utcnow().strftime('%Y%m%d-%H%M%S-%f')}-{uuid.uuid4().hex[:6]}"
+    summary = {
+        'id': profile_id,
+        'created_at': datetime.utcnow().isoformat(),
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'trigger': profile['trigger'],
+        'duration_ms': round(duration_ms, 2),
+        'query_count': len(queries),
+        'query_ms': round(sum(q[1] for q in queries), 2),
+        'statements': summarize_statements(queries),
+        'queries': [{'statement': s, 'duration_ms': round(ms, 3), 'executemany': many}
+                    for s, ms, many in queries[:PROFILE_MAX_QUERIES]],
+        'functions': summarize_functions(profile['profiler']),
+    }
+    try:
+        save_profile(summary, profile['profiler'])
+        response.headers['X-Profile-Id'] = profile_id
+    except OSError as e:
+        logger.warning(f"Could not save profile {profile_id}: {e}")
+    return response
+
+def discard_profile(exc=None):
+    """teardown_request: never leave a profiler running after a failed request"""
+    profile = g.pop('profile', None)
+    if profile:
+        profile['profiler'].disable()
+    profile_queries.queries = None
+
+def summarize_statements(queries):
+    """Identical statements grouped by total time - repeated ones point at N+1 queries"""
+    grouped = {}
+    for statement, ms, _ in queries:
+        entry = grouped.setdefault(statement, {'statement': statement, 'count': 0, 'total_ms': 0.0})
+        entry['count'] += 1
+        entry['total_ms'] += ms
+    rows = sorted(grouped.values(), key=lambda row: row['total_ms'], reverse=True)
+    for row in rows:
+        row['total_ms'] = round(row['total_ms'], 3)
+    return rows
+
+def summarize_functions(profiler):
+    """Top functions by cumulative time"""
+    stats = pstats.Stats(profiler).stats
+    rows = []
+    for (filename, line, name), (primitive_calls, calls, own, cumulative, _) in stats.items():
+        location = '/'.join(filename.split(os.sep)[-2:]) if filename != '~' else ''
+        rows.append({
+            'function': f'{name} ({location}:{line})' if location else name,
+            'calls': calls,
+            'primitive_calls': primitive_calls,
+            'own_ms': round(own * 1000, 3),
+            'cumulative_ms': round(cumulative * 1000, 3),
+        })
+    rows.sort(key=lambda row: row['cumulative_ms'], reverse=True)
+    return rows[:PROFILE_TOP_FUNCTIONS]
+
+def save_profile(summary, profiler):
+    """Write <id>.json and <id>.prof, then drop the oldest beyond PROFILE_KEEP"""
+    os.makedirs(PROFILE_FOLDER, exist_ok=True)
+    profiler.dump_stats(os.path.join(PROFILE_FOLDER, f"{summary['id']}.prof"))
+    temp_path = os.path.join(PROFILE_FOLDER, f".{summary['id']}.json.tmp")
+    with open(temp_path, 'w') as f:
+        json.dump(summary, f)
+    os.replace(temp_path, os.path.join(PROFILE_FOLDER, f"{summary['id']}.json"))
+
+    profile_ids = sorted(name[:-5] for name in os.listdir(PROFILE_FOLDER) if name.endswith('.json'))
+    for old_id in profile_ids[:-PROFILE_KEEP] if PROFILE_KEEP > 0 else profile_ids:
+        for extension in ('json', 'prof'):
+            try:
+                os.remove(os.path.join(PROFILE_FOLDER, f'{old_id}.{extension}'))
+            except FileNotFoundError:
+                pass
+
+def list_profiles():
+    """Stored profile summaries, newest first (without the per-query and per-function rows)"""
+    if not os.path.isdir(PROFILE_FOLDER):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(PROFILE_FOLDER), reverse=True):
+        if name.endswith('.json'):
+            profile = load_profile(name[:-5])
+            if profile:
+                profile.pop('queries', None)
+                profile.pop('functions', None)
+                profiles.append(profile)
+    return profiles
+
+def load_profile(profile_id):
+    """One stored profile - None if the id is malformed or the profile was pruned"""
+    if not PROFILE_ID_PATTERN.match(profile_id):
+        return None
+    try:
+        with open(os.path.join(PROFILE_FOLDER, f'{profile_id}.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def init_profiling(app):
+    """Register the profiling hooks - call before other hooks so the profile covers them"""
+    app.before_request(start_profile)
+    app.after_request(finish_profile)
+    app.teardown_request(discard_profile)
@@ -0,0 +1,89 @@
+// Broadcast overlay - messages, images or pages pushed by the admin over Server-Sent Events
+// Include with <script src="/static/broadcast.js" data-screen="<uuid>"></script> (no data-screen = global display)
+(function () {
+    const screenUuid = document.currentScript.dataset.screen || '';
+    let broadcasts = [];
+    let shownId = null;
+    let expiryTimer = null;
+    let overlay = null;
+
+    function getOverlay() {
+        if (!overlay) {
+            overlay = document.createElement('div');
+            overlay.id = 'broadcast-overlay';
+            overlay.style.cssText = 'position:fixed;inset:0;z-index:2147483647;background:#000;color:#fff;' +
+                'display:none;flex-direction:column;align-items:center;justify-content:center;text-align:center;' +
+                'font-family:Arial,sans-serif;';
+            document.body.appendChild(overlay);
+        }
+        return overlay;
+    }
+
+    function show(broadcast) {
+        const element = getOverlay();
+        element.innerHTML = '';
+        if (broadcast.url) {
+            const frame = document.createElement('iframe');
+            frame.src = broadcast.url;
+            frame.style.cssText = 'width:100%;height:100%;border:0;';
+            element.appendChild(frame);
+        } else {
+            if (broadcast.image) {
+                const img = document.createElement('img');
+                img.src = broadcast.image;
+                img.style.cssText = 'max-width:100%;max-height:' + (broadcast.message ? '75vh' : '100vh') + ';object-fit:contain;';
+                element.appendChild(img);
+            }
+            if (broadcast.message) {
+                const text = document.createElement('div');
+                text.textContent = broadcast.message;
+                text.style.cssText = 'font-size:' + (broadcast.image ? '5vh' : '9vh') + ';font-weight:bold;padding:3vh 5vw;' +
+                    'white-space:pre-wrap;line-height:1.2;';
+                element.appendChild(text);
+            }
+        }
+        element.style.display = 'flex';
+    }
+
+    function render() {
+        clearTimeout(expiryTimer);
+        const now = Date.now();
+        const active = broadcasts.filter(b => b.expiresAt > now);
+        const current = active[active.length - 1]; // Newest wins, the one before it returns when it expires
+
+        if (!current) {
+            if (overlay) {
+                overlay.style.display = 'none';
+                overlay.innerHTML = '';
+            }
+            shownId = null;
+        } else if (current.id !== shownId) {
+            console.log(`📢 Broadcast ${current.id}`);
+            show(current);
+            shownId = current.id;
+        }
+
+        if (active.length) {
+            const nextExpiry = Math.min(...active.map(b => b.expiresAt));
+            expiryTimer = setTimeout(render, nextExpiry - now + 50);
+        }
+    }
+
+    function connect() {
+        if (!window.EventSource) return;
+        const source = new EventSource('/api/broadcasts/stream' + (screenUuid ? '?screen=' + encodeURIComponent(screenUuid) : ''));
+        source.addEventListener('broadcast', (event) => {
+            const received = Date.now();
+            // Expiry comes as seconds from now, so a wrong screen clock doesn't matter
+            broadcasts = JSON.parse(event.data).map(b => Object.assign(b, {expiresAt: received + b.expires_in * 1000}));
+            render();
+        });
+        // EventSource reconnects on its own (server sets the retry delay)
+    }
+
+    if (document.body) {
+        connect();
+    } else {
+        document.addEventListener('DOMContentLoaded', connect);
+    }
+})();
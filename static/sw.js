@@ -5,7 +5,7 @@ const API_CACHE = 'magion-api-v3';
 
 // Cache limits
 const MAX_CACHE_SIZE = 100 * 1024 * 1024; // 100 MB
-const MAX_CACHE_ITEMS = 100; // Max 100 files
+const MAX_CACHE_ITEMS = 2000; // HLS videos are cached per segment, so an entry is a few seconds of video
 
 // Install event - cache core files
 self.addEventListener('install', (event) => {
@@ -42,6 +42,11 @@ self.addEventListener('activate', (event) => {
 self.addEventListener('fetch', (event) => {
     const url = new URL(event.request.url);
 
+    // Broadcast stream stays open - let the browser handle it directly
+    if (url.pathname === '/api/broadcasts/stream') {
+        return;
+    }
+
     // Cache media files (images and videos)
     if (url.pathname.startsWith('/media/') ||
         url.pathname.startsWith('/optimized/') ||
@@ -49,18 +54,30 @@ self.addEventListener('fetch', (event) => {
 
         event.respondWith(
             caches.open(MEDIA_CACHE).then((cache) => {
-                return cache.match(event.request).then((cachedResponse) => {
+                const range = event.request.headers.get('Range');
+                // Range requests (video) are matched against the cached full file
+                return cache.match(event.request.url).then((cachedResponse) => {
                     // Return cached version if available
                     if (cachedResponse) {
                         console.log('Serving from cache:', url.pathname);
-                        return cachedResponse;
+                        return range ? rangeResponse(range, cachedResponse) : cachedResponse;
                     }
 
                     // Otherwise fetch and cache
                     return fetch(event.request).then((networkResponse) => {
-                        // Only cache successful responses
-                        if (networkResponse && networkResponse.status === 200) {
-                            cache.put(event.request, networkResponse.clone()).then(() => {
+                        // Only cache complete files - a 206 counts when it covers the whole file (Range: bytes=0-)
+                        const complete = networkResponse && (networkResponse.status === 200 ||
+                            (networkResponse.status === 206 && coversWholeFile(networkResponse)));
+                        if (complete) {
+                            const copy = networkResponse.clone();
+                            const stored = networkResponse.status === 200 ? copy : new Response(copy.body, {
+                                status: 200,
+                                headers: {
+                                    'Content-Type': copy.headers.get('Content-Type') || '',
+                                    'Content-Length': copy.headers.get('Content-Range').split('/')[1]
+                                }
+                            });
+                            cache.put(event.request.url, stored).then(() => {
                                 // Check cache limits after adding new item
                                 enforceCacheLimit(MEDIA_CACHE);
                             });
@@ -123,6 +140,44 @@ self.addEventListener('fetch', (event) => {
     }
 });
 
+// Range responses from the cache
+function coversWholeFile(response) {
+    const match = /^bytes 0-(\d+)\/(\d+)$/.exec(response.headers.get('Content-Range') || '');
+    return match !== null && parseInt(match[1], 10) + 1 === parseInt(match[2], 10);
+}
+
+async function rangeResponse(range, response) {
+    const blob = await response.blob();
+    const match = /^bytes=(\d*)-(\d*)$/.exec(range.trim());
+    if (!match || (match[1] === '' && match[2] === '')) {
+        return new Response(blob, { status: 200, headers: response.headers });
+    }
+
+    let start, end;
+    if (match[1] === '') {
+        // Suffix range: the last N bytes
+        start = Math.max(0, blob.size - parseInt(match[2], 10));
+        end = blob.size - 1;
+    } else {
+        start = parseInt(match[1], 10);
+        end = match[2] === '' ? blob.size - 1 : Math.min(parseInt(match[2], 10), blob.size - 1);
+    }
+    if (start >= blob.size || start > end) {
+        return new Response(null, { status: 416, headers: { 'Content-Range': `bytes */${blob.size}` } });
+    }
+
+    return new Response(blob.slice(start, end + 1), {
+        status: 206,
+        statusText: 'Partial Content',
+        headers: {
+            'Content-Type': response.headers.get('Content-Type') || '',
+            'Content-Range': `bytes ${start}-${end}/${blob.size}`,
+            'Content-Length': String(end - start + 1),
+            'Accept-Ranges': 'bytes'
+        }
+    });
+}
+
 // Cache management functions
 async function getCacheSize(cacheName) {
     const cache = await caches.open(cacheName);
@@ -132,8 +187,9 @@ async function getCacheSize(cacheName) {
     for (const request of keys) {
         const response = await cache.match(request);
         if (response) {
-            const blob = await response.blob();
-            totalSize += blob.size;
+            // Content-Length avoids reading every segment back just to count it
+            const length = parseInt(response.headers.get('Content-Length') || '', 10);
+            totalSize += isNaN(length) ? (await response.blob()).size : length;
         }
     }
 
@@ -144,8 +200,9 @@ async function cleanupOldCache(cacheName, currentMediaList) {
     const cache = await caches.open(cacheName);
     const keys = await cache.keys();
 
-    // Get list of current media URLs
+    // Get list of current media URLs (plus the segment folders of HLS videos)
     const currentUrls = new Set(currentMediaList.map(m => m.path));
+    const currentFolders = currentMediaList.filter(m => m.stream).map(m => m.stream.substring(0, m.stream.lastIndexOf('/') + 1));
 
     let deletedCount = 0;
     for (const request of keys) {
@@ -153,7 +210,7 @@ async function cleanupOldCache(cacheName, currentMediaList) {
         const path = url.pathname;
 
         // Check if this cached file is still in the media list
-        if (!currentUrls.has(path)) {
+        if (!currentUrls.has(path) && !currentFolders.some(folder => path.startsWith(folder))) {
             await cache.delete(request);
             deletedCount++;
             console.log('Deleted old cached file:', path);